@@ -1,12 +1,17 @@
 import streamlit as st
-import pandas as pd
+import importlib
 import math
+import threading
 from datetime import datetime, timedelta, timezone
-import gspread
-from google.oauth2.service_account import Credentials
-import holidays
 import uuid
 import json
+from contextlib import nullcontext
+from types import MappingProxyType
+
+# 로그인 화면은 streamlit 만으로 그림. 아래 모듈은 로그인 뒤에 import 하고,
+# 로그인 화면이 뜨면 백그라운드에서 미리 불러 둠 (비밀번호를 치는 동안 import 가 끝남)
+HEAVY_MODULES = ("pandas", "numpy", "pyarrow.compute", "pyarrow.parquet", "gspread", "google.oauth2.service_account", "holidays",
+                 "storage", "mirror", "cache", "catalog", "orders", "bom", "schedule", "labels", "history", "journal", "production", "ph_series")
 
 # 1. 페이지 설정
 st.set_page_config(page_title="엘랑비탈 ERP", page_icon="🏥", layout="wide")
@@ -34,73 +39,165 @@ def check_password():
         return False
     return True
 
+@st.cache_resource
+def warm_up():
+    # 프로세스당 한 번: 무거운 모듈 import 를 백그라운드 스레드에서 (import 잠금이 있어 본 스크립트와 겹쳐도 안전)
+    def _run():
+        for name in HEAVY_MODULES:
+            try: importlib.import_module(name)
+            except Exception: pass  # 실제로 쓸 때 본 스크립트에서 다시 오류가 남
+    thread = threading.Thread(target=_run, name="warm-up", daemon=True)
+    thread.start()
+    return thread
+
 if not check_password():
+    warm_up()
     st.stop()
 
+import pandas as pd  # noqa: E402
+import holidays  # noqa: E402
+from gspread.utils import numericise  # noqa: E402
+from bom import explode  # noqa: E402
+from cache import CacheRegistry, apply_sheet_change  # noqa: E402
+from catalog import CATALOG, COUNT  # noqa: E402
+from history import HistoryCache  # noqa: E402
+from journal import COMMITTED, FAILED, WriteJournal  # noqa: E402
+from labels import label_document  # noqa: E402
+from mirror import SheetMirror, SqliteBackend  # noqa: E402
+from orders import demand_projection, parse_patients, recipe_materials, shipping_rollups  # noqa: E402
+from ph_series import PhSeriesStore, match_target, parse_targets  # noqa: E402
+from production import BatchIndex  # noqa: E402
+from refdata import RAW_MATERIALS, RECIPES, REGIMENS, SCHEDULE, overlay  # noqa: E402
+from schedule import BIWEEKLY_GROUPS, DeliveryCalendar, round_index  # noqa: E402
+from storage import MemoryBackend, RowConflict, SheetSession  # noqa: E402
+
 # 3. 구글 시트 데이터 로딩 및 저장 함수
-def get_gspread_client():
-    secrets = st.secrets["gcp_service_account"]
-    scopes = ["https://www.googleapis.com/auth/spreadsheets", "https://www.googleapis.com/auth/drive"]
-    creds = Credentials.from_service_account_info(secrets, scopes=scopes)
-    return gspread.authorize(creds)
+SHEET_HEADERS = {
+    "history": ["발송일", "이름", "그룹", "회차", "발송내역"],
+    "production": ["배치ID", "생산일", "종류", "원재료", "투입량(kg)", "비율", "완성(개)", "폐기(병)", "비고", "상태"],
+    "ph_logs": ["배치ID", "측정일시", "pH", "온도", "비고"],
+}
+
+def get_setting(section, key, default):
+    # secrets.toml 의 선택 항목 (없으면 기본값)
+    try: return st.secrets[section][key]
+    except Exception: return default
+
+# 세션(인증 클라이언트 + 시트 핸들)은 프로세스 전체에서 하나만 유지
+@st.cache_resource
+def get_sheet_session():
+    return SheetSession(st.secrets["gcp_service_account"])
+
+# 저장소 선택 ([storage] backend): sheets(기본) / sqlite(로컬 파일) / memory(지연 주입 가능한 가짜 시트)
+# sheets 에서 mirror = true 이면 로컬 SQLite 복제본에서 읽고, 쓰기는 로컬 반영 후 시트로 재전송
+@st.cache_resource
+def get_store():
+    backend = get_setting("storage", "backend", "sheets")
+    if backend == "sqlite": return SqliteBackend(get_setting("storage", "sqlite_path", "vpmi_mirror.db"))
+    if backend == "memory":
+        seed = get_setting("storage", "memory_seed", "")  # {시트명: [헤더, 행, ...]} JSON
+        with open(seed, encoding="utf-8") if seed else nullcontext() as f:
+            return MemoryBackend(json.load(f) if f else None, latency=get_setting("storage", "latency", 0.0))
+    if not get_setting("storage", "mirror", False): return get_sheet_session()
+    return SheetMirror(get_sheet_session(), get_setting("storage", "mirror_path", "vpmi_mirror.db"),
+                       sync_interval=get_setting("storage", "sync_interval", 30), on_change=get_cache().write)
+
+# 발송 가능일 달력: 올해 앞뒤 몇 년을 미리 계산 (범위 밖 날짜를 조회하면 그때 넓힘)
+# [delivery] blocked_weekdays(0=월 ... 6=일), block_holidays, block_holiday_eve 로 규칙 변경 가능
+@st.cache_resource
+def get_calendar():
+    year = datetime.now(KST).year
+    return DeliveryCalendar(lambda years: holidays.KR(years=years), range(year - 1, year + 3),
+                            blocked_weekdays=get_setting("delivery", "blocked_weekdays", [4, 5, 6]),
+                            block_holidays=get_setting("delivery", "block_holidays", True),
+                            block_holiday_eve=get_setting("delivery", "block_holiday_eve", True))
+
+# 발송 이력은 로컬 Parquet 캐시에서 조회 (새로 추가된 행만 시트에서 받아옴)
+@st.cache_resource
+def get_history():
+    return HistoryCache(get_store(), get_setting("storage", "history_path", "vpmi_history"), SHEET_HEADERS["history"],
+                        refresh_interval=get_setting("cache", "ttl", 60))
+
+# 쓰기 저널: 저장 버튼은 로컬 파일에 기록만 하고, 전송 스레드가 시트로 보냄 (끊기면 백오프 후 재시도)
+# [storage] journal = false 이면 예전처럼 저장 버튼에서 바로 시트에 씀
+# 로컬 미러([storage] mirror)를 쓰면 미러의 outbox 가 이미 같은 일을 하므로 저널은 끔
+# (저널이 미러에 쓰면 시트에 닿기 전에 '반영됨' 으로 표시되고 재시도 큐가 둘이 됨)
+@st.cache_resource
+def get_journal():
+    if not get_setting("storage", "journal", True): return None
+    if get_setting("storage", "backend", "sheets") == "sheets" and get_setting("storage", "mirror", False): return None
+    history = get_history()
+    return WriteJournal(get_store(), get_setting("storage", "journal_path", "vpmi_journal.db"),
+                        mutations={"production_status": lambda row, **args: _production_changes(row, **args)},
+                        on_commit=lambda sheet: sheet == "history" and history.mark_stale())
+
+# 데이터셋 캐시도 프로세스 공유: 리런/다른 탭에서는 네트워크를 타지 않음
+# 쓰기는 cache.write(시트명, 변경) 으로 알리면 그 시트에 의존하는 데이터셋만 갱신/무효화됨
+@st.cache_resource
+def get_cache():
+    reg = CacheRegistry(default_ttl=get_setting("cache", "ttl", 60))
+    reg.register("patients", fetch_patient_db)
+    # 발송 이력은 HistoryCache(get_history) 가 따로 관리하므로 여기서는 등록하지 않음
+    for sheet_name in SHEET_HEADERS:
+        if sheet_name == "history": continue
+        reg.register(sheet_name, lambda sheet_name=sheet_name: fetch_sheet_records(sheet_name), on_write=apply_sheet_change)
+    # 배치 상태 색인: 생산 시트에 쓰면 바뀐 배치만 다시 분류
+    reg.register("batches", lambda: BatchIndex(reg.get("production")), sources=("production",), on_write=lambda idx, change: idx.apply(change))
+    # 배치별 pH 시계열: 새 측정은 해당 배치에만 끼워 넣음
+    # 추세(종료 예측)도 같이 갱신: [ph] halflife_hours 가 지난 측정은 가중치 절반
+    reg.register("ph_series", lambda: PhSeriesStore(reg.get("ph_logs"), halflife=get_setting("ph", "halflife_hours", 24)),
+                 sources=("ph_logs",), on_write=lambda s, change: s.apply(change))
+    return reg
+
+def fetch_sheet_records(sheet_name):
+    records = get_store().read_records(sheet_name)
+    journal = get_journal()
+    if journal is None: return records
+    # 아직 전송 대기 중인 행도 화면에서 빠지지 않도록 뒤에 붙이고, 대기 중인 행 수정(상태 변경 등)도 다시 적용
+    header = SHEET_HEADERS[sheet_name]
+    records = records + [dict(zip(header, [numericise(v) if isinstance(v, str) else v for v in r])) for r in journal.pending_rows(sheet_name)]
+    return journal.replay_updates(sheet_name, records, header)
 
-@st.cache_data(ttl=60) 
 def load_data_from_sheet():
-    try:
-        client = get_gspread_client()
-        sheet = client.open("vpmi_data").sheet1
-        data = sheet.get_all_records()
-        
-        default_caps = {
-            "시원한 것": "280ml", "마시는 것": "280ml", "커드 시원한 것": "280ml",
-            "인삼 사이다": "300ml", "EX": "280ml",
-            "인삼대사체(PAGI)": "50ml", "인삼대사체(PAGI) 항암용": "50ml", "인삼대사체(PAGI) 뇌질환용": "50ml",
-            "개망초(EDF)": "50ml", "장미꽃 대사체": "50ml", "애기똥풀 대사체": "50ml",
-            "송이 대사체": "50ml", "표고버섯 대사체": "50ml", "철원산삼 대사체": "50ml",
-            "계란 커드": "150g" 
-        }
-
-        db = {}
-        for row in data:
-            name = row.get('이름')
-            if not name: continue
-            
-            items_list = []
-            raw_items = str(row.get('주문내역', '')).split(',')
-            for item in raw_items:
-                if ':' in item:
-                    p_name, p_qty = item.split(':')
-                    clean_name = p_name.strip()
-                    if clean_name == "PAGI 희석액": clean_name = "인삼대사체(PAGI) 항암용"
-                    if clean_name == "커드": clean_name = "계란 커드"
-                    cap = default_caps.get(clean_name, "")
-                    items_list.append({"제품": clean_name, "수량": int(p_qty.strip()), "용량": cap})
-            
-            round_val = row.get('회차')
-            if round_val is None or str(round_val).strip() == "": round_num = 1 
-            else:
-                try: round_num = int(str(round_val).replace('회', '').replace('주', '').strip())
-                except: round_num = 1
-
-            start_date_str = str(row.get('시작일', '')).strip()
-
-            db[name] = {
-                "group": row.get('그룹', ''), "note": row.get('비고', ''),
-                "default": True if str(row.get('기본발송', '')).upper() == 'O' else False,
-                "items": items_list, "round": round_num, "start_date_raw": start_date_str
-            }
-        return db
-    except Exception as e:
-        return {}
+    try: return get_cache().get("patients")["db"]
+    except Exception: return {}
+
+def load_order_errors():
+    # 주문내역 중 해석하지 못한 항목 (행, 환자, 항목, 사유)
+    try: return get_cache().get("patients")["errors"]
+    except Exception: return pd.DataFrame()
+
+def fetch_patient_db():
+    # 모든 세션이 같은 환자 DB 를 읽기 전용으로 같이 씀 (세션마다 복사하지 않음)
+    result = parse_patients(get_store().read_records(None))
+    result["db"] = MappingProxyType(result["db"])
+    return result
+
+def append_records(sheet_name, record_list):
+    # 모든 저장은 이 경로로: 시트가 없으면 헤더와 함께 생성, 행 수와 무관하게 요청 1회
+    # 저널이 있으면 저널 항목 id 를 돌려줌 (전송은 백그라운드)
+    header = SHEET_HEADERS[sheet_name]
+    journal = get_journal()
+    if journal is None: get_store().append_rows(sheet_name, record_list, header=header)
+    else: st.session_state.last_write = journal.append(sheet_name, record_list, header=header)
+    # get_all_records() 와 같은 형태로 캐시에 이어 붙임 (발송 이력은 HistoryCache 가 따로 갱신)
+    if sheet_name != "history": get_cache().write(sheet_name, {"append": [dict(zip(header, [numericise(v) if isinstance(v, str) else v for v in r])) for r in record_list]})
+
+def saved_message():
+    # 저장 버튼 안내: 시트 반영 여부
+    journal, entry = get_journal(), st.session_state.get("last_write")
+    if journal is None:
+        # 미러를 쓰면 미러 outbox 에 남아 있는지로 판단
+        store = get_store()
+        if isinstance(store, SheetMirror) and any(e["status"] == "pending" for e in store.outbox()): return "저장됨 (시트 전송 대기 중 - 연결되면 자동 전송)"
+        return "저장 완료!"
+    if entry is None or journal.status(entry) == COMMITTED: return "저장 완료!"
+    return "저장됨 (시트 전송 대기 중 - 연결되면 자동 전송)"
 
 def save_to_history(record_list):
     try:
-        client = get_gspread_client()
-        try: sheet = client.open("vpmi_data").worksheet("history")
-        except:
-            sheet = client.open("vpmi_data").add_worksheet(title="history", rows="1000", cols="10")
-            sheet.append_row(["발송일", "이름", "그룹", "회차", "발송내역"])
-        for record in record_list: sheet.append_row(record)
+        append_records("history", record_list)
+        get_history().mark_stale()
         return True
     except Exception as e:
         st.error(f"저장 실패: {e}")
@@ -108,12 +205,7 @@ def save_to_history(record_list):
 
 def save_production_record(record):
     try:
-        client = get_gspread_client()
-        try: sheet = client.open("vpmi_data").worksheet("production")
-        except:
-            sheet = client.open("vpmi_data").add_worksheet(title="production", rows="1000", cols="10")
-            sheet.append_row(["배치ID", "생산일", "종류", "원재료", "투입량(kg)", "비율", "완성(개)", "폐기(병)", "비고", "상태"])
-        sheet.append_row(record)
+        append_records("production", [record])
         return True
     except Exception as e:
         st.error(f"생산 이력 저장 실패: {e}")
@@ -121,58 +213,75 @@ def save_production_record(record):
 
 def save_ph_log(record):
     try:
-        client = get_gspread_client()
-        try: sheet = client.open("vpmi_data").worksheet("ph_logs")
-        except:
-            sheet = client.open("vpmi_data").add_worksheet(title="ph_logs", rows="1000", cols="10")
-            sheet.append_row(["배치ID", "측정일시", "pH", "온도", "비고"])
-        sheet.append_row(record)
+        append_records("ph_logs", [record])
         return True
     except Exception as e:
         st.error(f"pH 기록 저장 실패: {e}")
         return False
 
-def update_production_status(batch_id, new_status, add_done=0, add_fail=0):
+def update_production_status(batch_id, new_status, add_done=0, add_fail=0, expected_status=None):
     try:
-        client = get_gspread_client()
-        sheet = client.open("vpmi_data").worksheet("production")
-        cell = sheet.find(batch_id)
-        
-        if cell:
-            # 10번째 열: 상태
-            sheet.update_cell(cell.row, 10, new_status)
-            
-            # 7번째 열: 완성(개) - 누적
-            if add_done > 0:
-                current_done = sheet.cell(cell.row, 7).value
-                try: current_done = int(current_done)
-                except: current_done = 0
-                sheet.update_cell(cell.row, 7, current_done + add_done)
-                
-                # 9번째 열: 비고(Note)에 로그 추가
-                current_note = sheet.cell(cell.row, 9).value
-                log_msg = f"[{datetime.now(KST).strftime('%m/%d')}]+{add_done}"
-                new_note = f"{current_note}, {log_msg}" if current_note else log_msg
-                sheet.update_cell(cell.row, 9, new_note)
-            
-            # 8번째 열: 폐기(병) - 누적
-            if add_fail > 0:
-                current_fail = sheet.cell(cell.row, 8).value
-                try: current_fail = int(current_fail)
-                except: current_fail = 0
-                sheet.update_cell(cell.row, 8, current_fail + add_fail)
-                
+        header = SHEET_HEADERS["production"]
+        journal = get_journal()
+        if journal is not None:
+            # 캐시된 행으로 먼저 확인/반영하고, 시트에는 전송 시점의 행에 같은 변환을 다시 적용
+            args = {"new_status": new_status, "add_done": add_done, "add_fail": add_fail, "expected_status": expected_status}
+            rec = load_batches().get(batch_id)
+            applied = _production_changes([rec.get(h, "") for h in header], **args) if rec else None
+            st.session_state.last_write = journal.update("production", batch_id, "production_status", width=len(header), **args)
+            get_cache().write("production", {"patch": ("배치ID", batch_id, {header[col - 1]: val for col, val in applied.items()})} if applied else None)
             return True
+        applied = {}
+        def mutate(row):
+            applied.update(_production_changes(row, new_status, add_done, add_fail, expected_status))
+            return applied
+        ok = get_store().update_row("production", batch_id, mutate, width=len(header))
+        if ok: get_cache().write("production", {"patch": ("배치ID", batch_id, {header[col - 1]: val for col, val in applied.items()})})
+        return ok
+    except RowConflict:
+        st.warning("다른 사용자가 먼저 수정한 배치입니다. 새로고침 후 다시 입력하세요.")
         return False
     except Exception as e:
         st.error(f"업데이트 오류: {e}")
         return False
 
+def _production_changes(row, new_status, add_done, add_fail, expected_status):
+    # row: ["배치ID", "생산일", "종류", "원재료", "투입량(kg)", "비율", "완성(개)", "폐기(병)", "비고", "상태"]
+    if expected_status is not None and row[9] != expected_status: raise RowConflict(row[0])
+
+    # 10번째 열: 상태
+    changes = {10: new_status}
+
+    # 7번째 열: 완성(개) - 누적
+    if add_done > 0:
+        try: current_done = int(row[6])
+        except: current_done = 0
+        changes[7] = current_done + add_done
+
+        # 9번째 열: 비고(Note)에 로그 추가
+        current_note = row[8]
+        log_msg = f"[{datetime.now(KST).strftime('%m/%d')}]+{add_done}"
+        changes[9] = f"{current_note}, {log_msg}" if current_note else log_msg
+
+    # 8번째 열: 폐기(병) - 누적
+    if add_fail > 0:
+        try: current_fail = int(row[7])
+        except: current_fail = 0
+        changes[8] = current_fail + add_fail
+
+    return changes
+
+def load_batches():
+    try: return get_cache().get("batches")
+    except Exception: return BatchIndex()
+
+def load_ph_series():
+    try: return get_cache().get("ph_series")
+    except Exception: return PhSeriesStore()
+
 def load_sheet_data(sheet_name):
     try:
-        client = get_gspread_client()
-        sheet = client.open("vpmi_data").worksheet(sheet_name)
-        data = sheet.get_all_records()
+        data = get_cache().get(sheet_name)
         return pd.DataFrame(data)
     except:
         return pd.DataFrame()
@@ -184,105 +293,47 @@ def init_session_state():
     if 'view_month' not in st.session_state:
         st.session_state.view_month = st.session_state.target_date.month
 
-    if 'patient_db' not in st.session_state:
-        loaded_db = load_data_from_sheet()
-        st.session_state.patient_db = loaded_db if loaded_db else {}
-
-    if 'schedule_db' not in st.session_state:
-        st.session_state.schedule_db = {
-            1: {"title": "1월 (JAN)", "main": ["동백꽃", "인삼사이다", "유기농 우유 커드"], "note": "동백꽃 pH 3.8~4.0 도달 시 종료"},
-            2: {"title": "2월 (FEB)", "main": ["갈대뿌리", "당근"], "note": "갈대뿌리 수율 약 37%"},
-            3: {"title": "3월 (MAR)", "main": ["봄꽃 대사", "표고버섯"], "note": "꽃:줄기 1:1"},
-            4: {"title": "4월 (APR)", "main": ["애기똥풀", "등나무꽃"], "note": "애기똥풀 전초"},
-            5: {"title": "5월 (MAY)", "main": ["개망초+아카시아 합제", "아카시아꽃", "뽕잎"], "note": "계란커드 스타터용"},
-            6: {"title": "6월 (JUN)", "main": ["매실", "개망초"], "note": "매실 씨 제거"},
-            7: {"title": "7월 (JUL)", "main": ["토종홉 꽃", "연꽃", "무궁화"], "note": "여름철 대사 속도 주의"},
-            8: {"title": "8월 (AUG)", "main": ["풋사과"], "note": "1:6 비율"},
-            9: {"title": "9월 (SEP)", "main": ["청귤", "장미꽃"], "note": "추석 준비"},
-            10: {"title": "10월 (OCT)", "main": ["송이버섯", "표고버섯", "산자나무"], "note": "송이 등외품"},
-            11: {"title": "11월 (NOV)", "main": ["무염김치", "생지황", "인삼"], "note": "김장"},
-            12: {"title": "12월 (DEC)", "main": ["동백꽃", "메주콩"], "note": "마감"}
-        }
-
+    # 기준 데이터(refdata)와 환자 DB(캐시)는 프로세스 공유. 세션에는 이 세션에서 고친 것만 남김
     if 'yearly_memos' not in st.session_state:
         st.session_state.yearly_memos = []
 
-    if 'raw_material_list' not in st.session_state:
-        priority_list = [
-            "우유", "계란", "배추", "무", "마늘", "대파", "양파", "생강", "배", 
-            "고춧가루", "찹쌀가루", "새우젓", "멸치액젓", "올리고당", "조성액", "EX", "정제수",
-            "인삼", "동백꽃", "표고버섯", "개망초", "아카시아 꽃"
-        ]
-        full_list = [
-            "개망초", "개망초잎", "개망초꽃", "개망초가루", "아카시아 꽃", "아카시아 잎", "아카시아 꽃/잎", 
-            "애기똥풀 꽃", "애기똥풀 꽃/줄기", "동백꽃", "메주콩", "백태", "인삼", "수삼-5년근", "산양유", "우유", 
-            "철원 산삼", "인삼vpl", "갈대뿌리", "당근", "표고버섯", "등나무꽃", "등나무줄기", "등나무꽃/줄기", 
-            "개망초꽃8+아카시아잎1", "뽕잎", "뽕잎가루", "매실", "매실꽃", "매화꽃", "토종홉 꽃", "토종홉 꽃/잎", 
-            "연꽃", "무궁화꽃", "무궁화잎", "무궁화꽃/잎", "풋사과", "청귤", "장미꽃", "송이버섯", 
-            "산자나무열매", "싸리버섯", "무염김치", "생지황", "무염김칫물", "마늘", "대파", "부추", "저염김치", "유기농수삼",
-            "명태머리", "굵은멸치", "흑새우", "다시마", "냉동블루베리", "슈가", "원당", "이소말토 올리고당", "프락토 올리고당",
-            "고운 고춧가루", "굵은 고춧가루", "상황버섯", "영지버섯", "꽁치젓", "메가리젓", "어성초가루", "당두충가루"
-        ]
-        sorted_others = sorted(list(set(full_list) - set(priority_list)))
-        st.session_state.raw_material_list = priority_list + sorted_others
-
-    if 'product_list' not in st.session_state:
-        plist = [
-            "시원한 것", "마시는 것", "커드 시원한 것", "계란 커드", "EX",
-            "철원산삼 대사체", "인삼대사체(PAGI) 항암용", "인삼대사체(PAGI) 뇌질환용",
-            "표고버섯 대사체", "개망초(EDF)", "장미꽃 대사체",
-            "애기똥풀 대사체", "인삼 사이다", "송이 대사체",
-            "PAGI 희석액", "Vitamin C", "SiO2", "계란커드 스타터",
-            "혼합 [E.R.P.V.P]", "혼합 [P.V.E]", "혼합 [P.P.E]",
-            "혼합 [Ex.P]", "혼합 [R.P]", "혼합 [Edf.P]", "혼합 [P.P]"
-        ]
-        st.session_state.product_list = plist
-
-    if 'recipe_db' not in st.session_state:
-        r_db = {}
-        r_db["계란커드 스타터 [혼합]"] = {"desc": "대사체 단순 혼합", "batch_size": 9, "materials": {"개망초 대사체": 8, "아카시아잎 대사체": 1}}
-        r_db["계란커드 스타터 [합제]"] = {"desc": "원물 8:1 혼합 대사", "batch_size": 9, "materials": {"개망초꽃(원물)": 8, "아카시아잎(원물)": 1, "EX": 36}}
-        r_db["철원산삼 대사체"] = {"desc": "1:8 비율", "batch_size": 9, "materials": {"철원산삼": 1, "EX": 8}}
-        st.session_state.recipe_db = r_db
-    
     if 'regimen_db' not in st.session_state:
-        st.session_state.regimen_db = {
-            "울산 자궁근종": """1. 아침: 장미꽃 대사체 + 생수 350ml (격일)
-2. 취침 전: 인삼 전체 대사체 + 생수 1.8L 혼합물 500ml
-3. 식사 대용: 시원한 것 1병 + 계란-우유 대사체 1/2병
-4. 생활 습관: 자궁 보온, 기상 직후 골반 스트레칭
-5. 관리: 2주 단위 초음파 검사"""
-        }
+        st.session_state.regimen_db = overlay(REGIMENS)
 
 init_session_state()
 
 # 5. 메인 화면 (사이드바 모드 선택)
 st.sidebar.title("📌 메뉴 선택")
 app_mode = st.sidebar.radio("작업 모드를 선택하세요", ["🚛 배송/주문 관리", "🏭 생산/공정 관리"])
+if isinstance(get_store(), SheetMirror):
+    queued = [e for e in get_store().outbox() if e["status"] == "pending"]
+    if not get_store().online: st.sidebar.warning(f"📴 오프라인 모드 (로컬 데이터 사용, 전송 대기 {len(queued)}건)")
+    elif queued: st.sidebar.info(f"📤 전송 대기 {len(queued)}건")
+    failed = [e for e in get_store().outbox() if e["status"] != "pending"]
+    if failed:
+        with st.sidebar.expander(f"⚠️ 전송 실패/충돌 {len(failed)}건"):
+            for e in failed: st.write(f"- [{e['sheet']}] {e['op']}: {e['error']}")
+if get_journal() is not None:
+    journal = get_journal()
+    waiting = journal.pending_count()
+    if not journal.online: st.sidebar.warning(f"📴 시트 연결 안 됨 - 전송 대기 {waiting}건 (자동 재시도)")
+    elif waiting: st.sidebar.info(f"⏳ 시트 전송 중 {waiting}건")
+    if st.session_state.get("last_write") is not None:
+        state = journal.status(st.session_state.last_write)
+        st.sidebar.caption({COMMITTED: "✅ 마지막 저장: 시트 반영됨", FAILED: "⚠️ 마지막 저장: 전송 실패"}.get(state, "⏳ 마지막 저장: 전송 대기"))
+    failed = journal.failed()
+    if failed:
+        with st.sidebar.expander(f"⚠️ 저장 실패 {len(failed)}건"):
+            for e in failed:
+                st.write(f"- [{e['sheet']}] {e['op']}: {e['error']}")
+                c1, c2 = st.columns(2)
+                if c1.button("재시도", key=f"retry_{e['id']}"): journal.retry(e['id']); st.rerun()
+                if c2.button("삭제", key=f"discard_{e['id']}"): journal.discard(e['id']); st.rerun()
+with st.sidebar.expander("⚙️ 캐시 상태"):
+    st.dataframe(pd.DataFrame(get_cache().stats()), hide_index=True, use_container_width=True)
 
 st.title(f"🏥 엘랑비탈 ERP v.8.5 ({app_mode})")
 
-def calculate_round_v4(start_date_input, current_date_input, group_type):
-    try:
-        if not start_date_input or str(start_date_input) == 'nan': return 0, "날짜없음"
-        start_date = pd.to_datetime(start_date_input).date()
-        curr_date = current_date_input.date() if isinstance(current_date_input, datetime) else current_date_input
-        delta = (curr_date - start_date).days
-        if delta < 0: return 0, start_date.strftime('%Y-%m-%d')
-        weeks_passed = round(delta / 7)
-        r = weeks_passed + 1 if group_type == "매주 발송" else (weeks_passed // 2) + 1
-        return r, start_date.strftime('%Y-%m-%d')
-    except: return 1, "오류"
-
-kr_holidays = holidays.KR()
-def check_delivery_date(date_obj):
-    weekday = date_obj.weekday()
-    if weekday == 4: return False, "⛔ **금요일 발송 금지**"
-    if weekday >= 5: return False, "⛔ **주말 발송 불가**"
-    if date_obj in kr_holidays: return False, f"⛔ **휴일({kr_holidays.get(date_obj)})**"
-    next_day = date_obj + timedelta(days=1)
-    if next_day in kr_holidays: return False, f"⛔ **익일 휴일**"
-    return True, "✅ **발송 가능**"
 
 # ==============================================================================
 # [MODE 1] 배송/주문 관리
@@ -295,13 +346,15 @@ if app_mode == "🚛 배송/주문 관리":
 
     with col1: 
         target_date = st.date_input("발송일", value=datetime.now(KST), key="target_date", on_change=on_date_change)
-        is_ok, msg = check_delivery_date(target_date)
+        is_ok, msg = get_calendar().status(target_date)
         if is_ok: st.success(msg)
-        else: st.error(msg)
+        else:
+            st.error(msg)
+            st.caption("다음 발송 가능일: " + ", ".join(d.strftime('%m/%d') for d in get_calendar().next_valid(target_date, 3)))
 
     with col2:
         st.info(f"📅 **{target_date.year}년 {target_date.month}월 휴무일**")
-        month_holidays = [f"• {d.day}일: {n}" for d, n in kr_holidays.items() if d.year == target_date.year and d.month == target_date.month]
+        month_holidays = [f"• {d.day}일: {n}" for d, n in get_calendar().month_holidays(target_date.year, target_date.month)]
         if month_holidays:
             for h in month_holidays: st.write(h)
         else: st.write("• 휴일 없음")
@@ -309,13 +362,24 @@ if app_mode == "🚛 배송/주문 관리":
     st.divider()
 
     if st.button("🔄 데이터 새로고침"):
-        st.cache_data.clear()
-        st.session_state.patient_db = load_data_from_sheet()
+        get_cache().invalidate("patients")
         st.success("갱신 완료!")
         st.rerun()
 
-    db = st.session_state.patient_db
+    order_errors = load_order_errors()
+    if not order_errors.empty:
+        with st.expander(f"⚠️ 주문내역 오류 {len(order_errors)}건 (해당 항목은 제외됨)"):
+            st.dataframe(order_errors, hide_index=True, use_container_width=True)
+
+    db = load_data_from_sheet()
     sel_p = {}
+    rounds = round_index(db).at(target_date) if db else {}
+
+    with st.expander("🚨 회차 초과 예정 환자"):
+        weeks = st.number_input("앞으로 몇 주", 1, 26, 4, key="over_limit_weeks")
+        over = round_index(db).over_limit(target_date, weeks) if db else pd.DataFrame()
+        if over.empty: st.write("• 해당 환자 없음")
+        else: st.dataframe(over, hide_index=True, use_container_width=True)
 
     c1, c2 = st.columns(2)
     with c1:
@@ -323,7 +387,7 @@ if app_mode == "🚛 배송/주문 관리":
         if db:
             for k, v in db.items():
                 if v.get('group') == "매주 발송":
-                    r_num, s_date_disp = calculate_round_v4(v.get('start_date_raw'), target_date, "매주 발송")
+                    r_num, s_date_disp = rounds[k]
                     info = f" ({r_num}/12회)" 
                     if r_num > 12: info += " 🚨"
                     if st.checkbox(f"{k}{info}", v.get('default'), help=f"시작: {s_date_disp}"): sel_p[k] = {'items': v['items'], 'group': v['group'], 'round': r_num}
@@ -331,13 +395,14 @@ if app_mode == "🚛 배송/주문 관리":
         st.subheader("🚚 격주 발송")
         if db:
             for k, v in db.items():
-                if v.get('group') in ["격주 발송", "유방암", "울산"]:
-                    r_num, s_date_disp = calculate_round_v4(v.get('start_date_raw'), target_date, "격주 발송")
+                if v.get('group') in BIWEEKLY_GROUPS:
+                    r_num, s_date_disp = rounds[k]
                     info = f" ({r_num}/6회)"
                     if r_num > 6: info += " 🚨"
                     if st.checkbox(f"{k}{info}", v.get('default'), help=f"시작: {s_date_disp}"): sel_p[k] = {'items': v['items'], 'group': v['group'], 'round': r_num}
 
     st.divider()
+    rollup = shipping_rollups(sel_p, target_date, RECIPES)
     t1, t2, t3, t4 = st.tabs(["🏷️ 라벨", "🎁 장연구원", "🧪 한책임", "📊 커드 수요량"])
 
     # Tab 1: 라벨
@@ -351,51 +416,35 @@ if app_mode == "🚛 배송/주문 관리":
                     records = []
                     today_str = target_date.strftime('%Y-%m-%d')
                     for p_name, p_data in sel_p.items():
-                        content_str = ", ".join([f"{i['제품']}:{i['수량']}" for i in p_data['items']])
+                        content_str = p_data['items'].text()
                         records.append([today_str, p_name, p_data['group'], p_data['round'], content_str])
-                    if save_to_history(records): st.success("저장 완료!")
+                    if save_to_history(records): st.success(saved_message())
         
         if not sel_p: st.warning("환자를 선택하세요")
         else:
-            cols = st.columns(2)
-            for i, (name, data_info) in enumerate(sel_p.items()):
-                with cols[i%2]:
-                    with st.container(border=True):
-                        r_num = data_info['round']
-                        st.markdown(f"### 🧊 {name} [{r_num}회차]")
-                        st.caption(f"📅 {target_date.strftime('%Y-%m-%d')}")
-                        st.markdown("---")
-                        for x in data_info['items']:
-                            chk = "✅" if "혼합" in str(x['제품']) else "□"
-                            disp = x['제품'].replace(" 항암용", "")
-                            vol = f" ({x['용량']})" if x.get('용량') else ""
-                            st.markdown(f"**{chk} {disp}** {x['수량']}개{vol}")
-                        st.markdown("---")
-                        st.write("🏥 **엘랑비탈바이오**")
+            # 라벨 전체를 HTML 문서 하나로 (환자 수와 관계없이 화면 요소는 몇 개뿐)
+            _, label_html = label_document(sel_p, target_date)
+            st.download_button(f"🖨️ 라벨 {len(sel_p)}장 다운로드 (HTML, 브라우저에서 인쇄)", label_html,
+                               file_name=f"labels_{target_date.strftime('%Y%m%d')}.html", mime="text/html")
+            with st.expander("👀 미리보기", expanded=len(sel_p) <= 10):
+                # 라벨 문서의 body/* 스타일이 앱 화면에 번지지 않도록 iframe 안에 그림 (2열, 한 줄 약 200px)
+                st.iframe(label_html, height=min(800, 200 * math.ceil(len(sel_p) / 2) + 20))
 
     # Tab 2: 장연구원
     with t2:
         st.header("🎁 장연구원 (개별 포장)")
-        tot = {}
-        for data_info in sel_p.values():
-            items = data_info['items']
-            for x in items:
-                if "혼합" not in str(x['제품']):
-                    k = f"{x['제품']} {x['용량']}" if x.get('용량') else x['제품']
-                    tot[k] = tot.get(k, 0) + x['수량']
+        tot = rollup["packing"]
         df = pd.DataFrame(list(tot.items()), columns=["제품", "수량"]).sort_values("수량", ascending=False)
         st.dataframe(df, use_container_width=True)
 
     # Tab 3: 한책임
     with t3:
         st.header("🧪 한책임 (혼합 제조)")
-        req = {}
-        for data_info in sel_p.values():
-            items = data_info['items']
-            for x in items:
-                if "혼합" in str(x['제품']): req[x['제품']] = req.get(x['제품'], 0) + x['수량']
-        recipes = st.session_state.recipe_db
-        total_mat = {}
+        req = rollup["mixed"]
+        recipes = RECIPES
+        edited = {}
+        if rollup["bom"].get("error"): st.error(f"레시피 오류: {rollup['bom']['error']}")
+        if rollup["bom"]["missing"]: st.warning("레시피가 없어 재료 계산에서 빠진 제품: " + ", ".join(rollup["bom"]["missing"]))
         if not req: st.info("혼합 제품 없음")
         else:
             for p, q in req.items():
@@ -403,59 +452,61 @@ if app_mode == "🚛 배송/주문 관리":
                     with st.expander(f"📌 {p}", expanded=True):
                         c1, c2 = st.columns([1,2])
                         in_q = c1.number_input(f"{p} 수량", 0, value=q, key=f"{p}_{q}")
+                        edited[p] = in_q
                         r = recipes[p]
                         c2.markdown(f"**{r['desc']}**")
-                        ratio = in_q / r['batch_size'] if r['batch_size'] > 1 else in_q
-                        for m, mq in r['materials'].items():
-                            if isinstance(mq, (int, float)):
-                                calc = mq * ratio
-                                if "(50ml)" in m:
-                                    vol = calc * 50
-                                    c2.write(f"- {m}: **{calc:g}** (50*{calc:g}={vol:g} ml)")
-                                elif "EX" in m or "사이다" in m:
-                                    c2.write(f"- {m}: **{calc:g} ml**")
+                        for m, calc in recipe_materials(r, in_q):
+                            if isinstance(calc, (int, float)):
+                                u = CATALOG.meta(m)
+                                if u["per"] != COUNT:
+                                    c2.write(f"- {m}: **{calc:g} {u['per']}**")
+                                elif u["size"]:
+                                    c2.write(f"- {m}: **{calc:g}** ({u['size']:g}*{calc:g}={calc * u['size']:g} {u['unit']})")
                                 else:
-                                    c2.write(f"- {m}: **{calc:g} 개**")
-                                total_mat[m] = total_mat.get(m, 0) + calc
-                            else: c2.write(f"- {m}: {mq}")
+                                    c2.write(f"- {m}: **{calc:g} 개**{' (하위 레시피로 전개)' if m in recipes else ''}")
+                            else: c2.write(f"- {m}: {calc}")
+        # 수량을 고치지 않았으면 집계 결과를 그대로 사용
+        bom = rollup["bom"]
+        if not bom.get("error") and any(req[p] != q for p, q in edited.items()): bom = explode(edited, recipes)
+        total_mat = bom["raw"]
+        sub = {p: q for p, q in bom["intermediate"].items() if p not in req}
+        if sub: st.caption("하위 레시피 제조량: " + ", ".join(f"{p} {q:g}개" for p, q in sub.items()))
         st.divider()
         st.subheader("∑ 재료 총합")
         for k, v in sorted(total_mat.items(), key=lambda x: x[1], reverse=True):
-            if "PAGI" in k or "인삼대사체" in k:
-                vol_ml = v * 50
-                st.info(f"💧 **{k}**: {v:g}개 (총 {vol_ml:,.0f} ml)")
-            elif "사이다" in k:
-                bottles = v / 300
-                st.info(f"🥤 **{k}**: {v:,.0f} ml (약 {bottles:.1f}병)")
-            elif "EX" in k:
-                st.info(f"🛢️ **{k}**: {v:,.0f} ml (약 {v/1000:.1f} L)")
+            u = CATALOG.meta(k)
+            if u["per"] != COUNT:
+                size, pack = u["pack"] or (0, "")
+                st.info(f"{'🛢️' if pack == 'L' else '🥤'} **{k}**: {v:,.0f} {u['per']}" + (f" (약 {v / size:.1f}{pack})" if size else ""))
+            elif u["size"]:
+                st.info(f"💧 **{k}**: {v:g}개 (총 {v * u['size']:,.0f} {u['unit']})")
             else:
                 st.success(f"📦 **{k}**: {v:g} 개")
 
     # Tab 4: 커드 수요량
     with t4:
         st.header("📊 커드 수요량")
-        curd_pure = 0
-        curd_cool = 0
-        for data_info in sel_p.values():
-            items = data_info['items']
-            for x in items:
-                if x['제품'] == "계란 커드" or x['제품'] == "커드": 
-                    curd_pure += x['수량']
-                elif x['제품'] == "커드 시원한 것": 
-                    curd_cool += x['수량']
-        
-        need_from_cool = curd_cool * 40
-        need_from_pure = curd_pure * 150
-        total_kg = (need_from_cool + need_from_pure) / 1000
-        milk = (total_kg / 9) * 16
+        curd = rollup["curd"]
         
         c1, c2 = st.columns(2)
-        c1.metric("커드 시원한 것 (40g)", f"{curd_cool}개")
-        c2.metric("계란 커드 (150g)", f"{curd_pure}개")
+        c1.metric("커드 시원한 것 (40g)", f"{curd['curd_cool']}개")
+        c2.metric("계란 커드 (150g)", f"{curd['curd_pure']}개")
         st.divider()
-        st.info(f"🧀 **총 필요 커드:** 약 {total_kg:.2f} kg")
-        st.success(f"🥛 **필요 우유:** 약 {math.ceil(milk)}통")
+        st.info(f"🧀 **총 필요 커드:** 약 {curd['total_kg']:.2f} kg")
+        st.success(f"🥛 **필요 우유:** 약 {math.ceil(curd['milk'])}통")
+
+        # 커드는 대사/분리에 시간이 걸리므로 몇 주 앞까지 전체 환자 기준으로 미리 계산
+        st.divider()
+        st.subheader("📈 앞으로의 수요 (전체 환자)")
+        proj_weeks = st.number_input("예측 기간(주)", 1, 26, 4, key="projection_weeks")
+        proj = demand_projection(db, target_date, proj_weeks, get_calendar()) if db else None
+        if not proj or proj["daily"].empty: st.write("• 예측 기간에 발송 예정 없음")
+        else:
+            st.caption(f"{target_date:%m/%d} 부터 {proj_weeks}주, 발송 예정 환자 {proj['patients']}명 "
+                       "(시작일 기준 매주/격주, 회차 한도까지. 발송 불가일은 다음 발송 가능일로)")
+            st.dataframe(proj["weekly"], use_container_width=True)
+            st.bar_chart(proj["daily"]["커드(kg)"])
+            with st.expander("📅 날짜별"): st.dataframe(proj["daily"], use_container_width=True)
 
 # ==============================================================================
 # [MODE 2] 생산/공정 관리
@@ -516,7 +567,6 @@ elif app_mode == "🏭 생산/공정 관리":
                 rec = [batch_id, datetime.now(KST).strftime("%Y-%m-%d"), target_product, "우유+스타터", f"{milk_kg:.1f}", ratio_str, 0, 0, "커드생산", status_json]
                 
                 if save_production_record(rec):
-                    st.cache_data.clear()
                     st.success(f"[{batch_id}] 대사 시작! 유리병 {jars_count}개 입고됨.")
                     st.rerun()
 
@@ -524,67 +574,60 @@ elif app_mode == "🏭 생산/공정 관리":
 
         # 2. 대사 관리 (누적 로직 적용)
         st.subheader("🌡️ 2단계: 대사 관리 및 분리 (Metabolism & Separation)")
-        if st.button("🔄 상태 새로고침"): st.rerun()
+        if st.button("🔄 상태 새로고침"):
+            get_cache().invalidate("production")
+            get_cache().invalidate("batches")
+            st.rerun()
         
-        prod_df = load_sheet_data("production")
-        if not prod_df.empty:
-            curd_df = prod_df[prod_df['종류'].str.contains("커드", na=False)]
-            for idx, row in curd_df.iterrows():
-                try:
-                    status = json.loads(row['상태'])
-                    if status.get('meta', 0) == 0 and status.get('sep', 0) == 0: continue
-                except: continue
+        for row, status in load_batches().active_curd():
+            with st.container(border=True):
+                c_info, c_action = st.columns([2, 3])
+                with c_info:
+                    st.markdown(f"**[{row['배치ID']}] {row['종류']}** ({row['생산일']})")
+                    st.progress(1 - (status['meta'] / status['total']), text=f"진행률 (잔여 대사중: {status['meta']}병)")
+                    st.write(f"🫙 총 {status['total']} | 🔥 대사중 {status['meta']} | 💧 분리중 {status['sep']} | 🗑️ 폐기 {status['fail']}")
                 
-                with st.container(border=True):
-                    c_info, c_action = st.columns([2, 3])
-                    with c_info:
-                        st.markdown(f"**[{row['배치ID']}] {row['종류']}** ({row['생산일']})")
-                        st.progress(1 - (status['meta'] / status['total']), text=f"진행률 (잔여 대사중: {status['meta']}병)")
-                        st.write(f"🫙 총 {status['total']} | 🔥 대사중 {status['meta']} | 💧 분리중 {status['sep']} | 🗑️ 폐기 {status['fail']}")
-                    
-                    with c_action:
-                        with st.form(key=f"form_{row['배치ID']}"):
-                            c_act1, c_act2 = st.columns(2)
-                            move_sep = 0
-                            fail_cnt = 0
-                            pack_cnt = 0
-                            final_prod_cnt = 0
-
-                            if status['meta'] > 0:
-                                move_sep = c_act1.number_input(f"분리실 이동 (병)", 0, status['meta'], 0, key=f"sep_{row['배치ID']}")
-                                fail_cnt = c_act2.number_input(f"망침/폐기 (병)", 0, status['meta'], 0, key=f"fail_{row['배치ID']}")
+                with c_action:
+                    with st.form(key=f"form_{row['배치ID']}"):
+                        c_act1, c_act2 = st.columns(2)
+                        move_sep = 0
+                        fail_cnt = 0
+                        pack_cnt = 0
+                        final_prod_cnt = 0
+
+                        if status['meta'] > 0:
+                            move_sep = c_act1.number_input(f"분리실 이동 (병)", 0, status['meta'], 0, key=f"sep_{row['배치ID']}")
+                            fail_cnt = c_act2.number_input(f"망침/폐기 (병)", 0, status['meta'], 0, key=f"fail_{row['배치ID']}")
+                        
+                        if status['sep'] > 0:
+                            st.markdown("---")
+                            pack_cnt = st.number_input(f"포장 완료 (병)", 0, status['sep'], 0, key=f"pack_{row['배치ID']}")
+                            final_prod_cnt = st.number_input("금일 생산된 소포장(150g) 개수 (추가)", 0, 1000, 0, key=f"final_{row['배치ID']}")
+
+                        if st.form_submit_button("상태 및 결과 업데이트"):
+                            updated = False
+                            if move_sep > 0:
+                                status['meta'] -= move_sep
+                                status['sep'] += move_sep
+                                updated = True
+                            if fail_cnt > 0:
+                                status['meta'] -= fail_cnt
+                                status['fail'] += fail_cnt
+                                updated = True
+                            if pack_cnt > 0:
+                                status['sep'] -= pack_cnt
+                                status['done'] += pack_cnt
+                                updated = True
                             
-                            if status['sep'] > 0:
-                                st.markdown("---")
-                                pack_cnt = st.number_input(f"포장 완료 (병)", 0, status['sep'], 0, key=f"pack_{row['배치ID']}")
-                                final_prod_cnt = st.number_input("금일 생산된 소포장(150g) 개수 (추가)", 0, 1000, 0, key=f"final_{row['배치ID']}")
-
-                            if st.form_submit_button("상태 및 결과 업데이트"):
-                                updated = False
-                                if move_sep > 0:
-                                    status['meta'] -= move_sep
-                                    status['sep'] += move_sep
-                                    updated = True
-                                if fail_cnt > 0:
-                                    status['meta'] -= fail_cnt
-                                    status['fail'] += fail_cnt
-                                    updated = True
-                                if pack_cnt > 0:
-                                    status['sep'] -= pack_cnt
-                                    status['done'] += pack_cnt
-                                    updated = True
-                                
-                                if updated:
-                                    update_production_status(row['배치ID'], json.dumps(status), final_prod_cnt, fail_cnt)
-                                    st.cache_data.clear()
-                                    st.success("상태가 업데이트되고 생산량이 누적되었습니다!")
-                                    st.rerun()
+                            if updated and update_production_status(row['배치ID'], json.dumps(status), final_prod_cnt, fail_cnt, expected_status=row['상태']):
+                                st.success("상태가 업데이트되고 생산량이 누적되었습니다!")
+                                st.rerun()
 
     # Tab 6~8 (기존 유지)
     with t6:
         st.header(f"🗓️ 연간 생산 캘린더")
         sel_month = st.selectbox("월 선택", list(range(1, 13)), index=datetime.now(KST).month-1)
-        current_sched = st.session_state.schedule_db[sel_month]
+        current_sched = SCHEDULE[sel_month]
         with st.container(border=True):
             st.subheader("📝 연간 주요 메모")
             c_memo, c_m_tool = st.columns([2, 1])
@@ -628,12 +671,25 @@ elif app_mode == "🏭 생산/공정 관리":
 
     with t8:
         st.header("📂 발송 이력")
-        if st.button("🔄 이력 새로고침", key="ref_hist_prod"): st.rerun()
-        hist_df = load_sheet_data("history")
-        if not hist_df.empty:
-            st.dataframe(hist_df, use_container_width=True)
-            csv = hist_df.to_csv(index=False).encode('utf-8-sig')
-            st.download_button("📥 다운로드", csv, f"history.csv", "text/csv")
+        if st.button("🔄 이력 새로고침", key="ref_hist_prod"):
+            get_history().rebuild()
+            st.rerun()
+        history = get_history()
+        hc1, hc2, hc3 = st.columns([2, 2, 1])
+        h_range = hc1.date_input("발송일 범위", value=(), key="hist_range")
+        h_name = hc2.text_input("환자 이름", key="hist_name").strip()
+        h_size = hc3.selectbox("페이지당", [50, 100, 500], key="hist_size")
+        h_start = h_range[0] if len(h_range) > 0 else None
+        h_end = h_range[1] if len(h_range) > 1 else h_start
+        try:
+            _, h_total = history.page(h_start, h_end, h_name, 1, 0)
+            h_pages = max(1, math.ceil(h_total / h_size))
+            h_page = st.number_input(f"페이지 (총 {h_total:,}건, {h_pages}쪽)", 1, h_pages, 1, key="hist_page")
+            hist_df, _ = history.page(h_start, h_end, h_name, h_page, h_size)
+            st.dataframe(hist_df, use_container_width=True, hide_index=True)
+            # CSV 는 버튼을 눌렀을 때만 생성
+            st.download_button("📥 다운로드 (조회 조건 전체)", lambda: history.csv(h_start, h_end, h_name), "history.csv", "text/csv")
+        except Exception as e: st.error(f"이력 조회 실패: {e}")
 
     # Tab 9: 기타 생산 이력 (컬럼 순서 반영)
     with t9:
@@ -645,7 +701,7 @@ elif app_mode == "🏭 생산/공정 관리":
             p_date = c1.date_input("생산일", datetime.now(KST))
             p_type = c2.selectbox("종류", ["저염김치(0.3%)", "무염김치(0%)", "일반 식물 대사체", "철원산삼", "기타"])
             
-            rm_list = st.session_state.raw_material_list + ["(직접 입력)"]
+            rm_list = list(RAW_MATERIALS) + ["(직접 입력)"]
             p_name_sel = c3.selectbox("원재료명", rm_list)
             p_name = c3.text_input("직접 입력") if p_name_sel == "(직접 입력)" else p_name_sel
             
@@ -668,11 +724,13 @@ elif app_mode == "🏭 생산/공정 관리":
                 # [v.0.8.4] ["배치ID", "생산일", "종류", "원재료", "투입량(kg)", "비율", "완성(개)", "폐기(병)", "비고", "상태"]
                 rec = [batch_id, p_date.strftime("%Y-%m-%d"), p_type, p_name, p_weight, p_ratio, 0, 0, p_note, "진행중"]
                 if save_production_record(rec): 
-                    st.cache_data.clear()
-                    st.success("저장 완료!")
+                    st.success(saved_message())
                     st.rerun()
 
-        if st.button("🔄 이력 새로고침"): st.rerun()
+        if st.button("🔄 이력 새로고침"):
+            get_cache().invalidate("production")
+            get_cache().invalidate("batches")
+            st.rerun()
         prod_df = load_sheet_data("production")
         if not prod_df.empty: st.dataframe(prod_df, use_container_width=True)
 
@@ -684,12 +742,7 @@ elif app_mode == "🏭 생산/공정 관리":
             ph_date = c1.date_input("측정일", datetime.now(KST), key="ph_date")
             ph_time = c2.time_input("측정시간", datetime.now(KST).time())
             
-            prod_df = load_sheet_data("production")
-            batch_options = ["(직접입력)"]
-            if not prod_df.empty:
-                ongoing = prod_df[prod_df['상태'] == '진행중']
-                if not ongoing.empty:
-                    batch_options += ongoing.apply(lambda x: f"{x['배치ID']} ({x['원재료']})", axis=1).tolist()
+            batch_options = ["(직접입력)"] + [f"{b['배치ID']} ({b['원재료']})" for b in load_batches().running()]
                 
             c3, c4 = st.columns(2)
             sel_batch = c3.selectbox("배치 선택", batch_options)
@@ -706,12 +759,52 @@ elif app_mode == "🏭 생산/공정 관리":
                 dt_str = f"{ph_date.strftime('%Y-%m-%d')} {ph_time.strftime('%H:%M')}"
                 save_ph_log([batch_id_val, dt_str, ph_val, ph_temp, ph_memo])
                 if is_end and batch_id_val != "DIRECT":
-                    update_production_status(batch_id_val, "완료")
-                    st.cache_data.clear()
-                    st.success("대사 종료 처리됨!")
+                    if update_production_status(batch_id_val, "완료", expected_status="진행중"):
+                        st.success("대사 종료 처리됨!")
                 else: 
-                    st.success("저장됨!")
-
-        if st.button("🔄 pH 새로고침"): st.rerun()
-        ph_df = load_sheet_data("ph_logs")
-        if not ph_df.empty: st.dataframe(ph_df, use_container_width=True)
+                    st.success(saved_message())
+
+        if st.button("🔄 pH 새로고침"):
+            get_cache().invalidate("ph_logs")
+            get_cache().invalidate("ph_series")
+            st.rerun()
+        ph_store = load_ph_series()
+        ph_batches = ph_store.batches()
+        running = load_batches().running()
+        targets = parse_targets(SCHEDULE)
+        now_kst = datetime.now(KST).replace(tzinfo=None)
+        if running:
+            st.subheader("⏱️ 대사 종료 예측 (급한 순)")
+            st.caption("목표 pH 는 연간 일정 비고(예: 동백꽃 pH 3.8~4.0)에서 원재료 이름으로 찾습니다.")
+            st.dataframe(ph_store.urgency([(str(b['배치ID']), b.get('원재료', '')) for b in running], targets, now_kst),
+                         use_container_width=True, hide_index=True)
+        if ph_batches:
+            running_ids = [str(b['배치ID']) for b in running]
+            c1, c2 = st.columns([2, 1])
+            view_batch = c1.selectbox("📈 배치별 pH 추이", ph_batches,
+                                      index=ph_batches.index(running_ids[0]) if running_ids and running_ids[0] in ph_batches else 0)
+            ph_range = c2.date_input("기간", [], key="ph_range")
+            ph_start = ph_range[0] if len(ph_range) > 0 else None
+            ph_end = datetime.combine(ph_range[1], datetime.max.time()) if len(ph_range) > 1 else None
+            info = ph_store.summary(view_batch)
+            m1, m2, m3, m4 = st.columns(4)
+            m1.metric("최근 pH", info['최근 pH'], help=info['최근 측정'])
+            m2.metric("최저 / 최고", f"{info['최저 pH']} / {info['최고 pH']}")
+            m3.metric("측정 수", info['측정 수'])
+            m4.metric("일평균 측정", info['일평균 측정'])
+            daily = ph_store.daily_counts(view_batch)
+            if daily:
+                with st.expander("🗓️ 일별 측정 수"):
+                    st.bar_chart(pd.DataFrame({"날짜": list(daily), "측정 수": list(daily.values())}), x="날짜", y="측정 수")
+            view_rec = load_batches().get(view_batch)
+            band = match_target(view_rec.get('원재료') if view_rec else "", targets)
+            if band:
+                fc = ph_store.forecast(view_batch, band, now_kst)
+                msg = f"목표 pH {band[0]}~{band[1]} · {fc['상태']}"
+                if fc.get('예상 도달'): msg += f" · 예상 도달 {fc['예상 도달']} (약 {fc['남은 시간(h)']}시간 후)"
+                st.info(msg)
+            chart = ph_store.downsampled(view_batch, ph_start, ph_end)
+            if not chart.empty: st.line_chart(chart, x="측정일시", y="pH")
+            with st.expander("📋 배치별 pH 요약"):
+                only_running = st.checkbox("진행중 배치만", value=True)
+                st.dataframe(ph_store.summaries(running_ids if only_running else None), use_container_width=True, hide_index=True)
@@ -0,0 +1,255 @@
+# 데이터/집계 핫패스 벤치마크
+# - 합성 vpmi_data(환자 수천 명, 발송 이력 수만 건, 생산/pH 기록)를 만들어 메모리 저장소에 올린 뒤
+#   환자 DB 파싱, 회차 계산, 발송 탭 집계(장연구원/한책임/커드, 메모 적중 포함), 전체 환자 수요 예측, 커드 탭 상태 파싱 시간을 잰다
+# - 결과는 처리량과 p50/p99 를 JSON 으로 저장하고, --compare 로 이전 결과와 비교해 회귀를 잡는다
+#
+#   python bench/bench_hot_paths.py --out bench/results/base.json
+#   python bench/bench_hot_paths.py --compare bench/results/base.json
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import pandas as pd  # noqa: E402
+
+import labels  # noqa: E402
+import orders  # noqa: E402
+from orders import parse_patient_rows, shipping_rollups  # noqa: E402
+from history import HistoryCache  # noqa: E402
+from journal import WriteJournal  # noqa: E402
+from ph_series import PhSeriesStore, parse_targets  # noqa: E402
+from production import BatchIndex  # noqa: E402
+from schedule import RoundIndex, calculate_round_v4  # noqa: E402
+from storage import MemoryBackend  # noqa: E402
+
+PATIENT_HEADER = ["이름", "그룹", "비고", "기본발송", "주문내역", "회차", "시작일"]
+HISTORY_HEADER = ["발송일", "이름", "그룹", "회차", "발송내역"]
+PRODUCTION_HEADER = ["배치ID", "생산일", "종류", "원재료", "투입량(kg)", "비율", "완성(개)", "폐기(병)", "비고", "상태"]
+PH_HEADER = ["배치ID", "측정일시", "pH", "온도", "비고"]
+
+# 실제 주문내역에 나오는 이름 (별칭 포함)
+PRODUCTS = [
+    "시원한 것", "마시는 것", "커드 시원한 것", "커드", "계란 커드", "EX", "인삼 사이다",
+    "PAGI 희석액", "인삼대사체(PAGI) 뇌질환용", "개망초(EDF)", "장미꽃 대사체", "애기똥풀 대사체",
+    "송이 대사체", "표고버섯 대사체", "철원산삼 대사체",
+    "혼합 [E.R.P.V.P]", "혼합 [P.V.E]", "혼합 [P.P.E]", "혼합 [Ex.P]", "혼합 [R.P]", "혼합 [Edf.P]", "혼합 [P.P]",
+]
+GROUPS = ["매주 발송", "격주 발송", "유방암", "울산"]
+RECIPES = {
+    p: {"desc": "합성", "batch_size": 9, "materials": {"인삼대사체(PAGI) 항암용": 3, "EX": 36, "개망초(EDF)": 2, "비고": "혼합 후 냉장"}}
+    for p in PRODUCTS if p.startswith("혼합")
+}
+
+
+def make_dataset(n_patients, n_history, n_batches, n_ph, seed):
+    rnd = random.Random(seed)
+    today = date(2026, 10, 19)
+    patients = [PATIENT_HEADER]
+    for i in range(n_patients):
+        items = rnd.sample(PRODUCTS, rnd.randint(3, 7))
+        order = ", ".join(f"{p}:{rnd.choice([3, 7, 14, 21, 28, 42])}" for p in items)
+        start = today - timedelta(days=rnd.randint(0, 120))
+        patients.append([f"환자{i:05d}", rnd.choice(GROUPS), "", rnd.choice(["O", "X"]), order,
+                         rnd.choice(["", f"{rnd.randint(1, 12)}회", str(rnd.randint(1, 12))]), start.strftime("%Y-%m-%d")])
+
+    history = [HISTORY_HEADER]
+    for i in range(n_history):
+        p = patients[1 + rnd.randrange(n_patients)]
+        d = today - timedelta(days=rnd.randint(0, 720))
+        history.append([d.strftime("%Y-%m-%d"), p[0], p[1], rnd.randint(1, 12), p[4]])
+
+    production, batch_ids = [PRODUCTION_HEADER], []
+    for i in range(n_batches):
+        d = today - timedelta(days=rnd.randint(0, 720))
+        curd = rnd.random() < 0.5
+        kind = "계란 커드 (완제품)" if curd else "일반 식물 대사체"
+        bid = f"{d.strftime('%y%m%d')}-{kind}-{i:04x}"
+        batch_ids.append(bid)
+        if curd:
+            total = rnd.randint(5, 30)
+            meta = rnd.randint(0, total) if rnd.random() < 0.1 else 0
+            sep = rnd.randint(0, total - meta) if rnd.random() < 0.1 else 0
+            status = json.dumps({"total": total, "meta": meta, "sep": sep, "fail": 0, "done": total - meta - sep})
+        else:
+            status = "진행중" if rnd.random() < 0.1 else "완료"
+        production.append([bid, d.strftime("%Y-%m-%d"), kind, "우유+스타터" if curd else "동백꽃", 69.0, "1:8", 0, 0, "", status])
+
+    ph_logs = [PH_HEADER]
+    for i in range(n_ph):
+        d = datetime(2026, 10, 19) - timedelta(minutes=rnd.randint(0, 720 * 24 * 60))
+        ph_logs.append([rnd.choice(batch_ids), d.strftime("%Y-%m-%d %H:%M"), round(rnd.uniform(3.5, 6.5), 2), 30, ""])
+
+    return {"Sheet1": patients, "history": history, "production": production, "ph_logs": ph_logs}
+
+
+def select_patients(db, target_date):
+    # 발송 탭에서 기본 체크된 환자와 같은 방식으로 sel_p 구성
+    sel_p = {}
+    for k, v in db.items():
+        if not v.get('default'): continue
+        group = "매주 발송" if v.get('group') == "매주 발송" else "격주 발송"
+        r_num, _ = calculate_round_v4(v.get('start_date_raw'), target_date, group)
+        sel_p[k] = {'items': v['items'], 'group': v['group'], 'round': r_num}
+    return sel_p
+
+
+def cold_rollups(sel_p, target_date):
+    # 메모를 비우고 발송 탭 집계 전체 (장연구원/한책임/커드)
+    orders._rollup_memo.clear()
+    return shipping_rollups(sel_p, target_date, RECIPES)
+
+
+def cold_labels(sel_p, target_date):
+    labels._label_memo.clear()
+    return labels.label_document(sel_p, target_date)
+
+
+def cold_projection(db, target_date, weeks):
+    # 메모를 비우고 전체 환자 수요 예측 (발송 불가일 이동은 제외)
+    orders._projection_memo.clear()
+    return orders.demand_projection(db, target_date, weeks)
+
+
+def filtered_page(hist):
+    # 조건을 바꿔 가며 조회하는 경우: 거르기/정렬 + 50행 페이지 변환
+    hist._last = None
+    return hist.page("2026-01-01", "2026-06-30", "환자0", 2, 50)
+
+
+def measure(fn, items, repeat, warmup=2):
+    for _ in range(warmup): fn()
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    times.sort()
+    p50 = statistics.median(times)
+    p99 = statistics.quantiles(times, n=100, method="inclusive")[98] if len(times) > 1 else times[0]
+    return {"items": items, "repeat": repeat, "p50_ms": p50 * 1000, "p99_ms": p99 * 1000,
+            "mean_ms": statistics.fmean(times) * 1000, "throughput_per_s": items / p50 if p50 else None}
+
+
+def run(args):
+    sheets = make_dataset(args.patients, args.history, args.batches, args.ph, args.seed)
+    store = MemoryBackend(sheets)
+    target_date = date(2026, 10, 19)
+
+    records = store.read_records(None)
+    db = parse_patient_rows(records)
+    sel_p = select_patients(db, target_date)
+    prod_records = store.read_records("production")
+    prod_df = pd.DataFrame(prod_records)
+    batch_idx = BatchIndex(prod_records)
+    round_idx = RoundIndex(db)
+    ph_records = store.read_records("ph_logs")
+    ph_store = PhSeriesStore(ph_records)
+    ph_batch = ph_store.batches()[0]
+    ph_running = [(b['배치ID'], b['원재료']) for b in prod_records]
+    ph_targets = parse_targets({1: {"main": [], "note": "계란 pH 3.8~4.0"}})
+    ph_now = datetime(2026, 10, 19, 12, 0)
+    journal = WriteJournal(MemoryBackend(sheets), os.path.join(tempfile.mkdtemp(prefix="bench_journal_"), "journal.db"))
+    hist = HistoryCache(store, tempfile.mkdtemp(prefix="bench_history_"), HISTORY_HEADER)
+
+    def rounds():
+        for v in db.values():
+            group = "매주 발송" if v.get('group') == "매주 발송" else "격주 발송"
+            calculate_round_v4(v.get('start_date_raw'), target_date, group)
+
+    cases = {
+        "patients.fetch_records": (lambda: store.read_records(None), len(records)),
+        "patients.parse": (lambda: parse_patient_rows(records), len(records)),
+        "rounds.calculate_round_v4": (rounds, len(db)),
+        "rounds.index_build": (lambda: RoundIndex(db), len(db)),
+        "rounds.index_at": (lambda: round_idx.at(target_date), len(db)),
+        "rounds.over_limit_4w": (lambda: round_idx.over_limit(target_date, 4), len(db)),
+        "rounds.deliveries_26w": (lambda: round_idx.deliveries(target_date, 26 * 7), len(db)),
+        "projection.demand_4w": (lambda: cold_projection(db, target_date, 4), len(db)),
+        "projection.demand_26w": (lambda: cold_projection(db, target_date, 26), len(db)),
+        "rollup.shipping": (lambda: cold_rollups(sel_p, target_date), len(sel_p)),
+        "rollup.shipping_memo_hit": (lambda: shipping_rollups(sel_p, target_date, RECIPES), len(sel_p)),
+        "labels.render": (lambda: cold_labels(sel_p, target_date), len(sel_p)),
+        "labels.memo_hit": (lambda: labels.label_document(sel_p, target_date), len(sel_p)),
+        "production.load_frame": (lambda: pd.DataFrame(store.read_records("production")), len(prod_df)),
+        "curd_tab.status_parse": (lambda: BatchIndex(prod_records).active_curd(), len(prod_df)),
+        "batches.index_build": (lambda: BatchIndex(prod_records), len(prod_records)),
+        "batches.active_views": (lambda: (batch_idx.active_curd(), batch_idx.running()), len(prod_records)),
+        "ph.load_frame": (lambda: pd.DataFrame(store.read_records("ph_logs")), len(ph_records)),
+        "ph.index_build": (lambda: PhSeriesStore(ph_records), len(ph_records)),
+        "ph.batch_range_downsample": (lambda: ph_store.downsampled(ph_batch, date(2025, 1, 1), target_date), len(ph_records)),
+        "ph.summaries": (lambda: ph_store.summaries(), len(ph_records)),
+        "ph.urgency": (lambda: ph_store.urgency(ph_running, ph_targets, ph_now), len(ph_running)),
+        "ph.append_reading": (lambda: ph_store.apply({"append": [{"배치ID": ph_batch, "측정일시": "2026-10-19 12:00", "pH": 4.1, "온도": 30}]}), 1),
+        "journal.enqueue_ph": (lambda: journal.append("ph_logs", [[ph_batch, "2026-10-19 12:00", 4.1, 30, ""]], header=PH_HEADER), 1),
+        "history.load_frame": (lambda: pd.DataFrame(store.read_records("history")), args.history),
+        "history.filtered_page": (lambda: filtered_page(hist), args.history),
+    }
+    only = set(args.only.split(",")) if args.only else None
+    results = {}
+    for name, (fn, items) in cases.items():
+        if only and name not in only: continue
+        results[name] = measure(fn, items, args.repeat)
+        r = results[name]
+        print(f"{name:28s} p50 {r['p50_ms']:9.2f} ms  p99 {r['p99_ms']:9.2f} ms  {r['throughput_per_s'] or 0:12,.0f} items/s")
+
+    return {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(), "pandas": pd.__version__, "platform": platform.platform(),
+            "params": {k: getattr(args, k) for k in ("patients", "history", "batches", "ph", "repeat", "seed")},
+            "selected_patients": len(sel_p),
+        },
+        "results": results,
+    }
+
+
+def compare(current, baseline, threshold):
+    # p50 가 threshold 비율 이상 느려진 항목을 회귀로 보고
+    regressions = []
+    for name, r in current["results"].items():
+        base = baseline.get("results", {}).get(name)
+        if not base: continue
+        ratio = r["p50_ms"] / base["p50_ms"] if base["p50_ms"] else 1.0
+        flag = "REGRESSION" if ratio > 1 + threshold else ""
+        print(f"{name:28s} {base['p50_ms']:9.2f} -> {r['p50_ms']:9.2f} ms  x{ratio:5.2f} {flag}")
+        if flag: regressions.append(name)
+    return regressions
+
+
+def main():
+    ap = argparse.ArgumentParser(description="엘랑비탈 ERP 핫패스 벤치마크")
+    ap.add_argument("--patients", type=int, default=3000)
+    ap.add_argument("--history", type=int, default=30000)
+    ap.add_argument("--batches", type=int, default=2000)
+    ap.add_argument("--ph", type=int, default=20000)
+    ap.add_argument("--repeat", type=int, default=20)
+    ap.add_argument("--seed", type=int, default=7)
+    ap.add_argument("--only", default="", help="쉼표로 구분한 항목 이름만 실행")
+    ap.add_argument("--out", default=str(ROOT / "bench" / "results" / "latest.json"))
+    ap.add_argument("--compare", default="", help="비교할 이전 결과 JSON")
+    ap.add_argument("--threshold", type=float, default=0.2, help="회귀로 볼 p50 증가 비율")
+    args = ap.parse_args()
+
+    current = run(args)
+    out = Path(args.out)
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(current, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(f"저장: {out}")
+
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text(encoding="utf-8"))
+        if compare(current, baseline, args.threshold): sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
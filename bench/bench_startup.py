@@ -0,0 +1,86 @@
+# 시작 시간 벤치마크
+# - 새 파이썬 프로세스마다 app.py 를 (AppTest 로) 처음부터 실행해서 두 구간을 따로 잰다
+#   login: 프로세스 시작 ~ 로그인 화면이 다 그려질 때까지 (streamlit import 포함)
+#   first_data: 로그인 직후 ~ 첫 데이터 화면(발송 관리, 환자 DB 로딩 포함)이 다 그려질 때까지
+# - --think 는 로그인 화면에서 비밀번호를 치는 시간(초). 그동안 백그라운드 warm-up 이 import 를 끝냄
+# - 저장소는 합성 데이터를 올린 메모리 백엔드 (네트워크 시간 제외)
+#
+#   python bench/bench_startup.py --runs 5 --think 2
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+from datetime import datetime
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from bench_hot_paths import make_dataset  # noqa: E402
+
+_CHILD = r"""
+import json, sys, time
+t0 = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+app, storage, think = sys.argv[1], json.loads(sys.argv[2]), float(sys.argv[3])
+at = AppTest.from_file(app, default_timeout=300)
+at.secrets["storage"] = storage
+at.run()
+login = time.perf_counter() - t0
+assert not at.exception and at.text_input, "로그인 화면이 그려지지 않음"
+time.sleep(think)
+at.session_state["authenticated"] = True
+t1 = time.perf_counter()
+at.run()
+first_data = time.perf_counter() - t1
+assert not at.exception, [e.message for e in at.exception]
+print(json.dumps({"login_ms": login * 1000, "first_data_ms": first_data * 1000}))
+"""
+
+
+def run_once(app, storage, think):
+    out = subprocess.run([sys.executable, "-c", _CHILD, str(app), json.dumps(storage), str(think)],
+                         cwd=str(ROOT), capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    ap = argparse.ArgumentParser(description="엘랑비탈 ERP 시작 시간 벤치마크")
+    ap.add_argument("--app", default=str(ROOT / "app.py"))
+    ap.add_argument("--patients", type=int, default=3000)
+    ap.add_argument("--runs", type=int, default=5)
+    ap.add_argument("--think", type=float, default=0.0, help="로그인 화면에서 기다리는 시간(초)")
+    ap.add_argument("--seed", type=int, default=7)
+    ap.add_argument("--out", default=str(ROOT / "bench" / "results" / "startup.json"))
+    args = ap.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="bench_startup_")
+    seed_path = os.path.join(tmp, "seed.json")
+    with open(seed_path, "w", encoding="utf-8") as f:
+        json.dump(make_dataset(args.patients, 1000, 200, 1000, args.seed), f, ensure_ascii=False, default=str)
+    storage = {"backend": "memory", "memory_seed": seed_path,
+               "journal_path": os.path.join(tmp, "journal.db"), "history_path": os.path.join(tmp, "history")}
+
+    runs = [run_once(args.app, storage, args.think) for _ in range(args.runs)]
+    results = {}
+    for key in ("login_ms", "first_data_ms"):
+        values = sorted(r[key] for r in runs)
+        results[key] = {"p50": statistics.median(values), "min": values[0], "max": values[-1]}
+        print(f"{key:14s} p50 {results[key]['p50']:9.1f} ms  min {values[0]:9.1f}  max {values[-1]:9.1f}")
+
+    out = Path(args.out)
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps({
+        "meta": {"timestamp": datetime.now().isoformat(timespec="seconds"), "python": platform.python_version(),
+                 "platform": platform.platform(), "params": {k: getattr(args, k) for k in ("app", "patients", "runs", "think", "seed")}},
+        "results": results, "runs": runs,
+    }, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(f"저장: {out}")
+
+
+if __name__ == "__main__":
+    main()
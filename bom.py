@@ -0,0 +1,115 @@
+# 레시피(BOM) 전개
+# - recipe_db 를 계수 행렬로 컴파일: A[i, j] = 제품 i 1개를 만드는 데 드는 j 의 양
+#   (재료가 다른 레시피의 제품이면 그 제품도 다시 전개되는 중간재)
+# - 레시피 사이에 순환이 있으면 컴파일 단계에서 RecipeCycleError
+# - 전개는 행렬 곱으로: 총 소요 = d · (I + A + A² + ... + A^깊이), 순환이 없으므로 깊이만큼 곱하면 끝남
+# - 컴파일 결과와 전개 결과는 레시피 내용(JSON)을 키로 메모
+import functools
+import json
+from collections.abc import Mapping
+
+import numpy as np
+
+
+class RecipeCycleError(ValueError):
+    # 레시피가 자기 자신을 (직간접적으로) 재료로 쓰는 경우
+    pass
+
+
+def _is_amount(v):
+    return isinstance(v, (int, float)) and not isinstance(v, bool)
+
+
+def _per_unit(recipe):
+    # recipe_materials() 와 같은 비율: batch_size 개를 만들 때의 재료량 -> 1개당
+    size = recipe.get('batch_size', 1)
+    return 1 / size if size > 1 else 1
+
+
+def _topological(recipes):
+    # 하위 레시피가 먼저 오는 순서 + 최대 깊이. 순환이 있으면 경로를 담아 예외
+    order, state, depth = [], {}, {}
+
+    def visit(p, path):
+        if state.get(p) == "done": return depth[p]
+        if state.get(p) == "visiting":
+            cycle = path[path.index(p):] + [p]
+            raise RecipeCycleError("레시피 순환: " + " → ".join(cycle))
+        state[p] = "visiting"
+        d = 0
+        for m, q in recipes[p]['materials'].items():
+            if m in recipes and _is_amount(q): d = max(d, visit(m, path + [p]) + 1)
+        state[p], depth[p] = "done", d
+        order.append(p)
+        return d
+
+    levels = max((visit(p, []) for p in recipes), default=0)
+    return order, levels + 1
+
+
+class BomMatrix:
+    def __init__(self, recipes):
+        self.order, self.levels = _topological(recipes)
+        raw = []
+        for r in recipes.values():
+            for m, q in r['materials'].items():
+                if _is_amount(q) and m not in recipes and m not in raw: raw.append(m)
+        self.products = list(recipes)
+        self.raw = raw
+        self.names = self.products + raw
+        self.index = {n: i for i, n in enumerate(self.names)}
+
+        n = len(self.names)
+        direct = np.zeros((n, n))
+        for p, r in recipes.items():
+            per = _per_unit(r)
+            for m, q in r['materials'].items():
+                if _is_amount(q): direct[self.index[p], self.index[m]] += q * per
+        self.direct = direct
+
+        # 누적 계수: I + A + A² + ... (깊이만큼만 곱하면 0 이 됨)
+        total, power = np.eye(n), np.eye(n)
+        for _ in range(self.levels):
+            power = power @ direct
+            if not power.any(): break
+            total += power
+        self.total = total
+
+    def explode(self, demand):
+        # demand: {제품: 수량} -> {"raw": 원재료 총량, "intermediate": 만들어야 할 레시피 제품 수량, "missing": 레시피 없는 제품}
+        vec = np.zeros(len(self.names))
+        missing = []
+        for p, q in demand.items():
+            if p in self.index and p in self.products: vec[self.index[p]] += q
+            elif q: missing.append(p)
+        need = vec @ self.total
+        k = len(self.products)
+        return {
+            "raw": {m: float(need[k + i]) for i, m in enumerate(self.raw) if need[k + i]},
+            "intermediate": {p: float(need[i]) for i, p in enumerate(self.products) if need[i]},
+            "missing": missing,
+        }
+
+
+def _plain(v):
+    # 읽기 전용 기준 데이터(MappingProxyType)도 dict 처럼 직렬화
+    return dict(v) if isinstance(v, Mapping) else str(v)
+
+
+def recipe_key(recipes):
+    return json.dumps(recipes or {}, sort_keys=True, ensure_ascii=False, default=_plain)
+
+
+@functools.lru_cache(maxsize=16)
+def _compiled(key):
+    return BomMatrix(json.loads(key))
+
+
+@functools.lru_cache(maxsize=256)
+def _exploded(key, demand):
+    return _compiled(key).explode(dict(demand))
+
+
+def explode(demand, recipes):
+    # 발송일 하루치 수요 전체를 한 번의 행렬 곱으로 전개 (같은 레시피/수요면 메모)
+    return _exploded(recipe_key(recipes), tuple(sorted(demand.items())))
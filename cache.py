@@ -0,0 +1,113 @@
+# 데이터셋 캐시 레지스트리 (프로세스 공유)
+# - 데이터셋마다 이름/로더/TTL/원본 시트를 등록
+# - 시트에 쓰기가 생기면 그 시트에 의존하는 데이터셋만 갱신하거나 무효화
+# - 데이터셋별 적중률을 집계
+# - 다시 읽다가 실패하면(일시적인 시트/API 오류) 마지막으로 읽은 값을 계속 쓰고 잠시 뒤 다시 시도
+import threading
+import time
+
+STALE_RETRY = 10  # 다시 읽기에 실패했을 때 이전 값을 쓰는 시간(초)
+
+
+class _Dataset:
+    def __init__(self, name, loader, ttl, sources, on_write):
+        self.name = name
+        self.loader = loader
+        self.ttl = ttl
+        self.sources = tuple(sources)
+        self.on_write = on_write
+        self.value = None
+        self.expires = 0.0
+        self.loaded_at = None
+        self.load_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.errors = 0
+        self.generation = 0
+
+    def fresh(self):
+        return self.loaded_at is not None and self.expires > time.monotonic()
+
+
+class CacheRegistry:
+    def __init__(self, default_ttl=60):
+        self.default_ttl = default_ttl
+        self._lock = threading.Lock()
+        self._datasets = {}
+
+    def register(self, name, loader, ttl=None, sources=(), on_write=None):
+        # on_write(현재값, 변경내용) -> 새 값 (None 을 돌려주면 무효화)
+        with self._lock:
+            self._datasets[name] = _Dataset(name, loader, self.default_ttl if ttl is None else ttl, sources or (name,), on_write)
+
+    def get(self, name):
+        ds = self._datasets[name]
+        with self._lock:
+            if ds.fresh():
+                ds.hits += 1
+                return ds.value
+        # 같은 데이터셋을 동시에 두 번 읽지 않도록 데이터셋별로 로딩
+        with ds.load_lock:
+            with self._lock:
+                if ds.fresh():
+                    ds.hits += 1
+                    return ds.value
+                ds.misses += 1
+                generation = ds.generation
+            try: value = ds.loader()
+            except Exception:
+                with self._lock:
+                    ds.errors += 1
+                    if ds.loaded_at is None: raise
+                    ds.expires = time.monotonic() + min(ds.ttl, STALE_RETRY)
+                    return ds.value
+            with self._lock:
+                # 읽는 도중 쓰기가 있었다면 그 값은 캐시에 넣지 않음
+                if generation == ds.generation:
+                    ds.value, ds.loaded_at = value, time.monotonic()
+                    ds.expires = ds.loaded_at + ds.ttl
+            return value
+
+    def invalidate(self, name):
+        ds = self._datasets[name]
+        with self._lock: self._drop(ds)
+
+    def _drop(self, ds):
+        ds.generation += 1
+        if ds.loaded_at is not None: ds.invalidations += 1
+        ds.value, ds.loaded_at, ds.expires = None, None, 0.0
+
+    def write(self, source, change=None):
+        # source 시트에 쓰기가 일어났을 때 호출: 의존 데이터셋만 갱신/무효화
+        with self._lock:
+            for ds in self._datasets.values():
+                if source not in ds.sources: continue
+                if ds.loaded_at is None:
+                    ds.generation += 1
+                    continue
+                new_value = ds.on_write(ds.value, change) if ds.on_write and change is not None else None
+                if new_value is None: self._drop(ds)
+                else: ds.value = new_value
+
+    def stats(self):
+        with self._lock:
+            rows = []
+            for ds in self._datasets.values():
+                total = ds.hits + ds.misses
+                rows.append({
+                    "데이터셋": ds.name, "적중": ds.hits, "미적중": ds.misses,
+                    "적중률": round(ds.hits / total, 3) if total else 0.0,
+                    "무효화": ds.invalidations, "읽기 실패": ds.errors,
+                    "경과(초)": round(time.monotonic() - ds.loaded_at, 1) if ds.loaded_at is not None else None,
+                })
+            return rows
+
+
+def apply_sheet_change(records, change):
+    # 시트 레코드 데이터셋용 write-through 훅
+    if "append" in change: return records + list(change["append"])
+    if "patch" in change:
+        key_field, key, values = change["patch"]
+        return [dict(r, **values) if r.get(key_field) == key else r for r in records]
+    return None
@@ -0,0 +1,162 @@
+# 제품 카탈로그 + 주문 항목 저장
+# - 제품명마다 정수 id 를 한 번만 부여(intern)하고 용량/분류는 id 로 찾는 목록에 보관 (단위는 meta(name))
+# - 환자 주문은 (제품 id, 수량) 정수 배열 두 개로만 보관 -> 항목마다 dict/문자열을 만들지 않음
+#   환자 DB 전체 배열을 한 번 만들고, 환자별 OrderItems 는 그 배열의 구간(view)만 가리킴
+# - 집계는 id 로 인덱싱 (np.bincount)
+# - 분류(혼합/단일/원재료), 기준 단위, 단위 크기, 별칭은 PRODUCT_TABLE 한 곳에 두고 이름마다 한 번만 풀어서 사용
+#   (이름에 'EX', '사이다' 같은 글자가 들어 있는지로 판단하지 않음)
+import re
+import threading
+
+import numpy as np
+import pandas as pd
+
+from refdata import PRODUCTS, RECIPES
+
+MIXED, SINGLE, RAW = "mixed", "single", "raw"
+COUNT = "개"
+_CAP = re.compile(r"^(\d+(?:\.\d+)?)\s*([a-zA-Z]+)$")
+_SUFFIX = re.compile(r"\((\d+(?:\.\d+)?)\s*([a-zA-Z]+)\)\s*$")
+
+
+def _item(category, cap="", per=COUNT, pack=None, aliases=()):
+    # cap: 1개 용량("280ml"), per: 레시피 수량 단위('개' 또는 ml 같은 기준 단위), pack: 총량 환산 (크기, 이름)
+    m = _CAP.match(cap)
+    unit, size = (m.group(2), float(m.group(1))) if m else ("", 0.0)
+    if pack is None and per != COUNT and size: pack = (size, "병")
+    return {"category": category, "cap": cap, "unit": unit, "size": size, "per": per, "pack": pack, "aliases": tuple(aliases)}
+
+
+# 제품 메타데이터 (환자 시트에 용량이 없으므로 용량도 여기서). 분류/단위 판단은 이름 문자열이 아니라 이 표로
+PRODUCT_TABLE = {
+    "시원한 것": _item(SINGLE, "280ml"), "마시는 것": _item(SINGLE, "280ml"), "커드 시원한 것": _item(SINGLE, "280ml"),
+    "계란 커드": _item(SINGLE, "150g", aliases=("커드",)),
+    "EX": _item(SINGLE, "280ml", per="ml", pack=(1000, "L")),
+    "인삼 사이다": _item(SINGLE, "300ml", per="ml", aliases=("인삼사이다",)),
+    "인삼대사체(PAGI) 항암용": _item(SINGLE, "50ml", aliases=("PAGI 희석액",)),
+    "인삼대사체(PAGI)": _item(SINGLE, "50ml"), "인삼대사체(PAGI) 뇌질환용": _item(SINGLE, "50ml"),
+    "개망초(EDF)": _item(SINGLE, "50ml"), "장미꽃 대사체": _item(SINGLE, "50ml"), "애기똥풀 대사체": _item(SINGLE, "50ml"),
+    "송이 대사체": _item(SINGLE, "50ml"), "표고버섯 대사체": _item(SINGLE, "50ml"), "철원산삼 대사체": _item(SINGLE, "50ml"),
+    "Vitamin C": _item(SINGLE), "SiO2": _item(SINGLE), "계란커드 스타터": _item(SINGLE),
+    "혼합 [E.R.P.V.P]": _item(MIXED), "혼합 [P.V.E]": _item(MIXED), "혼합 [P.P.E]": _item(MIXED), "혼합 [Ex.P]": _item(MIXED),
+    "혼합 [R.P]": _item(MIXED), "혼합 [Edf.P]": _item(MIXED), "혼합 [P.P]": _item(MIXED),
+    "계란커드 스타터 [혼합]": _item(MIXED), "계란커드 스타터 [합제]": _item(MIXED),
+}
+# 옛 이름/다른 표기 -> 제품명
+ALIASES = {a: name for name, meta in PRODUCT_TABLE.items() for a in meta["aliases"]}
+
+
+class ProductCatalog:
+    def __init__(self, names=()):
+        self._lock = threading.Lock()
+        self._ids = {}
+        self._meta = {}
+        self.names, self.caps, self.categories, self.mixed = [], [], [], []
+        for n in names: self.intern(n)
+
+    def intern(self, name):
+        # 제품명 -> id (처음 보는 이름이면 새 id, 별칭은 제품명의 id). id 는 프로세스 안에서 바뀌지 않음
+        pid = self._ids.get(name)
+        if pid is not None: return pid
+        if name in ALIASES:
+            pid = self.intern(ALIASES[name])
+            self._ids[name] = pid
+            return pid
+        with self._lock:
+            pid = self._ids.get(name)
+            if pid is not None: return pid
+            meta = PRODUCT_TABLE.get(name)
+            # 표에 없는 이름은 레시피가 있거나 이름에 '혼합' 이 있으면 혼합 제품 (한 번만 분류)
+            category = meta["category"] if meta else MIXED if name in RECIPES or "혼합" in name else SINGLE
+            # 목록을 먼저 채우고 마지막에 id 를 공개 (다른 스레드가 id 로 바로 읽어도 안전)
+            self.names.append(name); self.caps.append(meta["cap"] if meta else "")
+            self.categories.append(category); self.mixed.append(category == MIXED)
+            pid = len(self.names) - 1
+            self._ids[name] = pid
+            return pid
+
+    def meta(self, name):
+        # 제품/원재료 이름 -> 메타데이터 (한 번 풀어서 메모). 표/별칭에 없으면 원재료:
+        # 이름 끝의 "(50ml)" 같은 용량 표기가 있으면 그 용량의 '개' 단위, 없으면 그냥 '개'
+        meta = self._meta.get(name)
+        if meta is None:
+            meta = PRODUCT_TABLE.get(ALIASES.get(name, name))
+            if meta is None:
+                m = _SUFFIX.search(name)
+                meta = _item(RAW, f"{m.group(1)}{m.group(2)}" if m else "")
+            self._meta[name] = meta
+        return meta
+
+    def intern_all(self, names):
+        # 이름 목록 -> id 배열
+        return np.fromiter((self.intern(n) for n in names), dtype=np.int32, count=len(names))
+
+    def __len__(self):
+        return len(self.names)
+
+
+CATALOG = ProductCatalog(PRODUCTS)
+
+
+class OrderItems:
+    # 환자 한 명의 주문 (제품 id 배열, 수량 배열). 만든 뒤 수정하지 않음
+    __slots__ = ("ids", "qty")
+
+    def __init__(self, ids, qty):
+        self.ids, self.qty = ids, qty
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __iter__(self):
+        # (제품명, 수량, 용량) - 화면/기록용
+        names, caps = CATALOG.names, CATALOG.caps
+        for pid, q in zip(self.ids.tolist(), self.qty.tolist()): yield names[pid], q, caps[pid]
+
+    def pairs(self):
+        return zip(self.ids.tolist(), self.qty.tolist())
+
+    def text(self):
+        # 주문내역 형식 "제품:수량, ..."
+        return ", ".join(f"{p}:{q}" for p, q, _ in self)
+
+
+class OrderTable:
+    # 정규화된 주문표: 주문 항목 하나가 한 줄인 (행, 제품 id, 수량) 배열 + 행별 환자 이름
+    # 행 번호는 오름차순 -> 환자별 OrderItems 는 이 배열의 구간(view)
+    __slots__ = ("rows", "ids", "qty", "patients", "_frame")
+
+    def __init__(self, rows, ids, qty, patients):
+        self.rows, self.ids, self.qty, self.patients = rows, ids, qty, patients
+        self._frame = None
+
+    @classmethod
+    def of(cls, selected):
+        # {이름: {'items': OrderItems, ...}} -> 선택된 환자만의 주문표 (환자 구간을 이어 붙임, 행 = 선택 순서)
+        names = list(selected)
+        items = [selected[n]['items'] for n in names]
+        if not any(len(o) for o in items): return cls(np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.int64), names)
+        rows = np.repeat(np.arange(len(items)), [len(o) for o in items])
+        return cls(rows, np.concatenate([o.ids for o in items]), np.concatenate([o.qty for o in items]), names)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def split(self):
+        # 행별 OrderItems (배열 구간 view, 복사 없음)
+        bounds = np.searchsorted(self.rows, np.arange(len(self.patients) + 1))
+        return [OrderItems(self.ids[a:b], self.qty[a:b]) for a, b in zip(bounds[:-1].tolist(), bounds[1:].tolist())]
+
+    def totals(self):
+        # 제품 id 별 (수량 합, 항목 수) 배열 (길이 = 카탈로그 크기) - groupby 대신 bincount 한 번
+        n = len(CATALOG)
+        if not len(self.ids): return np.zeros(n, dtype=np.int64), np.zeros(n, dtype=np.int64)
+        return np.bincount(self.ids, weights=self.qty, minlength=n).astype(np.int64), np.bincount(self.ids, minlength=n)
+
+    def frame(self):
+        # (환자, 제품, 수량, 용량) DataFrame - 화면/내보내기용이라 처음 부를 때 만들고 보관
+        if self._frame is None:
+            names, caps = np.array(CATALOG.names, dtype=object), np.array(CATALOG.caps, dtype=object)
+            self._frame = pd.DataFrame({"환자": np.array(self.patients, dtype=object)[self.rows] if len(self.rows) else [],
+                                        "제품": names[self.ids], "수량": self.qty, "용량": caps[self.ids]})
+        return self._frame
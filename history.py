@@ -0,0 +1,125 @@
+# 발송 이력 로컬 컬럼 캐시 (Parquet)
+# - history 시트는 행이 추가되기만 하므로, 캐시한 행 수 이후의 새 행만 받아와 Parquet 파트 파일로 덧붙임
+# - 재시작해도 파트 파일을 읽어 이어서 동기화 (시트 전체를 다시 받지 않음)
+# - 조회는 Arrow 테이블에서 날짜/환자 조건으로 거른 뒤 요청한 페이지만 pandas 로 변환
+import os
+import threading
+import time
+
+import gspread
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from storage import is_unavailable
+
+COMPACT_PARTS = 32  # 파트 파일이 이만큼 쌓이면 하나로 합침
+
+
+class HistoryCache:
+    def __init__(self, store, path, header, title="history", refresh_interval=60):
+        self.store = store
+        self.path = path
+        self.header = list(header)
+        self.title = title
+        self.refresh_interval = refresh_interval
+        self._lock = threading.Lock()
+        self._schema = pa.schema([(h, pa.string()) for h in self.header])
+        self._table = self._schema.empty_table()
+        self._parts = []
+        self._checked_at = 0.0
+        self._last = None
+        os.makedirs(path, exist_ok=True)
+        self._load()
+
+    # --- 파트 파일 ---
+    def _load(self):
+        # part-<시작행>.parquet 를 순서대로 읽음. 중간이 비어 있으면 그 앞까지만 사용
+        tables, rows = [], 0
+        for name in sorted(f for f in os.listdir(self.path) if f.startswith("part-") and f.endswith(".parquet")):
+            if int(name[5:-8]) != rows: break
+            t = pq.read_table(os.path.join(self.path, name), schema=self._schema)
+            tables.append(t)
+            self._parts.append(name)
+            rows += t.num_rows
+        if tables: self._table = pa.concat_tables(tables)
+
+    def _write_part(self, table, start):
+        name = f"part-{start:09d}.parquet"
+        tmp = os.path.join(self.path, name + ".tmp")
+        pq.write_table(table, tmp)
+        os.replace(tmp, os.path.join(self.path, name))
+        self._parts.append(name)
+
+    def _compact(self):
+        old = self._parts
+        self._parts = []
+        self._write_part(self._table, 0)
+        for name in old:
+            if name != self._parts[0]: os.remove(os.path.join(self.path, name))
+
+    def _clear(self):
+        for name in self._parts: os.remove(os.path.join(self.path, name))
+        self._parts, self._table, self._last = [], self._schema.empty_table(), None
+
+    def _to_table(self, records):
+        return pa.table({h: pa.array(["" if r.get(h) is None else str(r.get(h)) for r in records], pa.string()) for h in self.header},
+                        schema=self._schema)
+
+    # --- 동기화 ---
+    def refresh(self, force=False):
+        # 마지막 확인 후 refresh_interval 이 지났으면 새로 추가된 행만 받아옴
+        with self._lock:
+            if not force and time.monotonic() - self._checked_at < self.refresh_interval: return 0
+            try: new = self.store.read_records_from(self.title, self._table.num_rows)
+            except gspread.exceptions.WorksheetNotFound:
+                # 이력 시트가 없으면 행이 0개인 것으로 (빈 표)
+                self._clear()
+                new = []
+            self._checked_at = time.monotonic()
+            if not new: return 0
+            added = self._to_table(new)
+            self._write_part(added, self._table.num_rows)
+            self._table = pa.concat_tables([self._table, added])
+            if len(self._parts) >= COMPACT_PARTS: self._compact()
+            return added.num_rows
+
+    def rebuild(self):
+        # 시트에서 행이 지워졌거나 수정된 경우: 캐시를 비우고 처음부터 다시 받음
+        with self._lock:
+            self._clear()
+            self._checked_at = 0.0
+        self.refresh(force=True)
+
+    def mark_stale(self):
+        self._checked_at = 0.0
+
+    # --- 조회 ---
+    def filtered(self, start=None, end=None, patient=""):
+        # 발송일 start~end (YYYY-MM-DD 문자열 비교), 이름에 patient 포함. 최근 발송일부터
+        try: self.refresh()
+        except Exception as e:
+            if not is_unavailable(e): raise  # 오프라인이면 캐시된 행만으로 조회
+        t = self._table
+        key = (str(start), str(end), patient, t.num_rows)
+        if self._last is not None and self._last[0] == key: return self._last[1]
+        mask = None
+        def _and(m, cond): return cond if m is None else pc.and_(m, cond)
+        if start: mask = _and(mask, pc.greater_equal(t["발송일"], str(start)))
+        if end: mask = _and(mask, pc.less_equal(t["발송일"], str(end)))
+        if patient: mask = _and(mask, pc.match_substring(t["이름"], patient))
+        if mask is not None: t = t.filter(mask)
+        t = t.take(pc.sort_indices(t, [("발송일", "descending")]))
+        self._last = (key, t)  # 페이지만 넘길 때는 다시 거르지 않음
+        return t
+
+    def page(self, start=None, end=None, patient="", page=1, page_size=50):
+        # -> (해당 페이지 DataFrame, 조건에 맞는 전체 행 수)
+        t = self.filtered(start, end, patient)
+        return t.slice((page - 1) * page_size, page_size).to_pandas(), t.num_rows
+
+    def csv(self, start=None, end=None, patient=""):
+        return self.filtered(start, end, patient).to_pandas().to_csv(index=False).encode('utf-8-sig')
+
+    def __len__(self):
+        return self._table.num_rows
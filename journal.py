@@ -0,0 +1,181 @@
+# 쓰기 저널 (로컬 SQLite) + 백그라운드 전송
+# - 저장 버튼은 저널 파일에 기록만 하고 바로 돌아감 (시트 호출을 기다리지 않음)
+# - 전송 스레드가 대기 항목을 순서대로 묶어서 보냄: 같은 시트로 연속된 추가는 append 1회
+# - 네트워크 끊김/쿼터 초과는 지수 백오프로 재시도, 충돌/그 밖의 오류는 '실패'로 남겨 화면에서 재시도/삭제
+# - 프로세스가 재시작돼도 파일에 남은 대기 항목을 이어서 전송
+#   (시트 반영 직후 완료 표시 전에 죽으면 그 항목은 한 번 더 전송될 수 있음)
+# - 행 수정은 변경값이 아니라 (변환 이름, 인자) 로 기록 -> 전송 시점의 시트 행에 다시 적용 (누적값이 덮어써지지 않음)
+import json
+import random
+import sqlite3
+import threading
+import time
+
+from storage import RowConflict, is_unavailable
+
+PENDING, COMMITTED, FAILED = "pending", "committed", "failed"
+BATCH_SIZE = 50          # 한 번에 꺼내는 항목 수
+KEEP_COMMITTED = 200     # 전송 완료 항목은 최근 것만 남김 (상태 표시용)
+
+
+class WriteJournal:
+    def __init__(self, store, path, mutations=None, on_commit=None, base_delay=1.0, max_delay=300.0):
+        # mutations: {이름: fn(현재 행, **인자) -> {열번호: 새값}}, on_commit(시트명): 전송 완료 알림
+        self.store = store
+        self.mutations = dict(mutations or {})
+        self.on_commit = on_commit
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.online = True
+        self.last_error = None
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._attempts = 0
+        self._next_try = 0.0
+        with self._db:
+            self._db.execute("CREATE TABLE IF NOT EXISTS journal (id INTEGER PRIMARY KEY AUTOINCREMENT, sheet TEXT, op TEXT, payload TEXT, "
+                             "created_at REAL, status TEXT DEFAULT 'pending', error TEXT, committed_at REAL)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS ix_journal_status ON journal (status, id)")
+        self._worker = threading.Thread(target=self._run, name="write-journal", daemon=True)
+        self._worker.start()
+
+    # --- 기록 ---
+    def _add(self, sheet, op, payload):
+        with self._lock, self._db:
+            cur = self._db.execute("INSERT INTO journal (sheet, op, payload, created_at) VALUES (?, ?, ?, ?)",
+                                   (sheet, op, json.dumps(payload, ensure_ascii=False, default=str), time.time()))
+        self._wake.set()
+        return cur.lastrowid
+
+    def append(self, sheet, rows, header=None):
+        return self._add(sheet, "append", {"rows": [list(r) for r in rows], "header": header})
+
+    def update(self, sheet, key, mutation, width=10, **args):
+        if mutation not in self.mutations: raise KeyError(mutation)
+        return self._add(sheet, "update", {"key": key, "mutation": mutation, "args": args, "width": width})
+
+    # --- 전송 ---
+    def _run(self):
+        while True:
+            wait = self._next_try - time.monotonic()
+            if wait > 0: self._wake.wait(wait)
+            else: self._wake.wait(None if not self.pending_count() else 0)
+            self._wake.clear()
+            if time.monotonic() < self._next_try: continue
+            try: self.flush()
+            except Exception as e:
+                # 전송 스레드는 멈추지 않음 (로컬 파일 오류 등은 백오프 후 다시)
+                self._backoff(e)
+
+    def flush(self):
+        # 대기 항목을 순서대로 전송. 재시도할 오류가 나면 거기서 멈추고 백오프
+        with self._lock:
+            entries = self._db.execute("SELECT id, sheet, op, payload FROM journal WHERE status = ? ORDER BY id LIMIT ?", (PENDING, BATCH_SIZE)).fetchall()
+        sent = 0
+        for group in _groups(entries):
+            ids = [e[0] for e in group]
+            sheet, op = group[0][1], group[0][2]
+            try:
+                if op == "append":
+                    payloads = [json.loads(e[3]) for e in group]
+                    self.store.append_rows(sheet, [r for p in payloads for r in p["rows"]], header=payloads[0]["header"])
+                else:
+                    p = json.loads(group[0][3])
+                    fn, args = self.mutations[p["mutation"]], p["args"]
+                    if not self.store.update_row(sheet, p["key"], lambda row: fn(row, **args), width=p["width"]):
+                        raise LookupError(f"행 없음: {p['key']}")
+                status, error = COMMITTED, None
+            except Exception as e:
+                if is_unavailable(e):
+                    self._backoff(e)
+                    break
+                status, error = FAILED, f"다른 곳에서 먼저 수정됨: {e}" if isinstance(e, RowConflict) else f"{type(e).__name__}: {e}"
+            self.online, self._attempts, self._next_try = True, 0, 0.0
+            with self._lock, self._db:
+                self._db.executemany("UPDATE journal SET status = ?, error = ?, committed_at = ? WHERE id = ?",
+                                     [(status, error, time.time() if status == COMMITTED else None, i) for i in ids])
+            if status == COMMITTED:
+                sent += len(ids)
+                if self.on_commit: self.on_commit(sheet)
+        self._prune()
+        if sent and self.pending_count(): self._wake.set()  # 남은 항목이 있으면 이어서
+        return sent
+
+    def _backoff(self, e):
+        self.online = False
+        self.last_error = str(e)
+        self._attempts += 1
+        delay = min(self.base_delay * 2 ** (self._attempts - 1), self.max_delay)
+        self._next_try = time.monotonic() + delay * random.uniform(0.5, 1.0)
+
+    def _prune(self):
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM journal WHERE status = ? AND id NOT IN (SELECT id FROM journal WHERE status = ? ORDER BY id DESC LIMIT ?)",
+                             (COMMITTED, COMMITTED, KEEP_COMMITTED))
+
+    # --- 상태 ---
+    def pending_count(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM journal WHERE status = ?", (PENDING,)).fetchone()[0]
+
+    def status(self, entry_id):
+        # 'pending' / 'committed' / 'failed' (정리된 오래된 항목은 committed)
+        with self._lock:
+            row = self._db.execute("SELECT status FROM journal WHERE id = ?", (entry_id,)).fetchone()
+        return row[0] if row else COMMITTED
+
+    def pending_rows(self, sheet):
+        # 아직 전송되지 않은 추가 행 (시트를 다시 읽을 때 화면에서 빠지지 않도록)
+        with self._lock:
+            rows = self._db.execute("SELECT payload FROM journal WHERE sheet = ? AND op = 'append' AND status = ? ORDER BY id", (sheet, PENDING)).fetchall()
+        return [r for (p,) in rows for r in json.loads(p)["rows"]]
+
+    def pending_updates(self, sheet):
+        # 아직 전송되지 않은 행 수정 [{"key", "mutation", "args", "width"}] (기록 순서)
+        with self._lock:
+            rows = self._db.execute("SELECT payload FROM journal WHERE sheet = ? AND op = 'update' AND status = ? ORDER BY id", (sheet, PENDING)).fetchall()
+        return [json.loads(p) for (p,) in rows]
+
+    def replay_updates(self, sheet, records, header):
+        # 다시 읽은 시트 레코드 위에 대기 중인 행 수정을 순서대로 다시 적용 (키는 첫 열)
+        # 적용할 수 없는 수정(행 없음/충돌)은 건너뜀 -> 전송 시점에 실패로 남음
+        updates = self.pending_updates(sheet)
+        if not updates: return records
+        records = list(records)
+        pos = {r.get(header[0]): i for i, r in enumerate(records)}
+        for u in updates:
+            i = pos.get(u["key"])
+            if i is None: continue
+            rec = records[i]
+            try: changes = self.mutations[u["mutation"]]([rec.get(h, "") for h in header], **u["args"])
+            except Exception: continue
+            records[i] = dict(rec, **{header[col - 1]: v for col, v in changes.items()})
+        return records
+
+    def failed(self):
+        with self._lock:
+            rows = self._db.execute("SELECT id, sheet, op, payload, error, created_at FROM journal WHERE status = ? ORDER BY id", (FAILED,)).fetchall()
+        return [{"id": r[0], "sheet": r[1], "op": r[2], "payload": json.loads(r[3]), "error": r[4], "created_at": r[5]} for r in rows]
+
+    def retry(self, entry_id):
+        with self._lock, self._db:
+            self._db.execute("UPDATE journal SET status = ?, error = NULL WHERE id = ? AND status = ?", (PENDING, entry_id, FAILED))
+        self._next_try = 0.0
+        self._wake.set()
+
+    def discard(self, entry_id):
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM journal WHERE id = ? AND status = ?", (entry_id, FAILED))
+
+
+def _groups(entries):
+    # 같은 시트로 연속된 추가는 하나로 묶음 (순서는 유지), 수정은 하나씩
+    group = []
+    for e in entries:
+        if group and not (e[2] == "append" and group[-1][2] == "append" and e[1] == group[-1][1]):
+            yield group
+            group = []
+        group.append(e)
+    if group: yield group
@@ -0,0 +1,66 @@
+# 발송 라벨 문서
+# - 선택된 환자 전체 라벨을 HTML 문서 하나로 한 번에 생성 (환자/품목마다 위젯을 만들지 않음)
+# - 인쇄 시 배경색/테두리가 브라우저 '배경 그래픽' 설정과 무관하게 나오도록 print-color-adjust 지정
+# - 같은 내용이면 다시 만들지 않도록 내용 해시로 메모
+import collections
+import html
+import threading
+
+from catalog import CATALOG
+
+LABEL_MEMO_SIZE = 16
+_label_memo = collections.OrderedDict()
+_label_lock = threading.Lock()
+
+_STYLE = """
+@page { size: A4; margin: 10mm; }
+* { box-sizing: border-box; -webkit-print-color-adjust: exact; print-color-adjust: exact; }
+body { font-family: 'Malgun Gothic', 'Apple SD Gothic Neo', 'Noto Sans KR', sans-serif; margin: 0; }
+.sheet { display: grid; grid-template-columns: 1fr 1fr; gap: 6mm; }
+.label { border: 1.5px solid #333; border-radius: 3mm; padding: 4mm 5mm; break-inside: avoid; page-break-inside: avoid; }
+.label h3 { margin: 0 0 1mm; font-size: 15pt; }
+.date { color: #555; font-size: 9pt; margin-bottom: 2mm; }
+.items { border-top: 1px solid #999; border-bottom: 1px solid #999; padding: 2mm 0; margin: 0; list-style: none; }
+.items li { font-size: 11pt; line-height: 1.5; }
+.items li.mixed { background: #e8f5e9; }
+.footer { margin-top: 2mm; font-weight: bold; font-size: 10pt; }
+"""
+
+
+def label_rows(sel_p):
+    # ((이름, 회차, ((체크, 표시명, 수량, 용량), ...)), ...) - 라벨에 찍히는 내용만 (해시 가능한 튜플)
+    names, caps, mixed = CATALOG.names, CATALOG.caps, CATALOG.mixed
+    return tuple((str(name), info['round'], tuple(("✅" if mixed[pid] else "□", names[pid].replace(" 항암용", ""), q, caps[pid])
+                                                  for pid, q in info['items'].pairs()))
+                 for name, info in sel_p.items())
+
+
+def _label(name, round_num, items, date_str):
+    lines = "".join(
+        f"<li class=\"{'mixed' if chk == '✅' else ''}\"><b>{chk} {html.escape(disp)}</b> {qty}개{f' ({html.escape(vol)})' if vol else ''}</li>"
+        for chk, disp, qty, vol in items)
+    return (f"<div class=\"label\"><h3>🧊 {html.escape(name)} [{round_num}회차]</h3>"
+            f"<div class=\"date\">📅 {date_str}</div><ul class=\"items\">{lines}</ul>"
+            f"<div class=\"footer\">🏥 엘랑비탈바이오</div></div>")
+
+
+def render_labels(rows, date_str):
+    body = "".join(_label(name, r, items, date_str) for name, r, items in rows)
+    return (f"<!DOCTYPE html><html lang=\"ko\"><head><meta charset=\"utf-8\"><title>발송 라벨 {date_str}</title>"
+            f"<style>{_STYLE}</style></head><body><div class=\"sheet\">{body}</div></body></html>")
+
+
+def label_document(sel_p, target_date):
+    # -> (내용 해시, HTML 문서). 같은 라벨 내용이면 메모된 문서를 그대로 돌려줌
+    date_str = target_date.strftime('%Y-%m-%d')
+    rows = label_rows(sel_p)
+    key = (date_str, rows)  # 해시 충돌이 나도 내용 비교로 걸러짐
+    with _label_lock:
+        if key in _label_memo:
+            _label_memo.move_to_end(key)
+            return hash(key), _label_memo[key]
+    doc = render_labels(rows, date_str)
+    with _label_lock:
+        _label_memo[key] = doc
+        while len(_label_memo) > LABEL_MEMO_SIZE: _label_memo.popitem(last=False)
+    return hash(key), doc
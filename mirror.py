@@ -0,0 +1,332 @@
+# vpmi_data 로컬 SQLite 복제본
+# - 환자 DB(첫 시트)와 history/production/ph_logs 를 인덱스가 있는 로컬 테이블로 유지
+# - 동기화는 증분: 새로 추가된 행만 받아오고, 수정되는 열(production 상태 등)만 다시 비교
+# - 쓰기는 로컬에 먼저 반영하고 outbox 에 쌓았다가 연결되면 순서대로 재전송
+import json
+import sqlite3
+import threading
+import time
+
+from gspread.utils import numericise, rowcol_to_a1
+
+from storage import Backend, RowConflict, is_unavailable
+
+# sheet=None 은 첫 번째 시트(환자 DB). full: 매번 전체 비교(작은 시트), append: 새 행만 + mutable 열만 비교
+TABLES = {
+    "patients": {"sheet": None, "mode": "full", "indexes": ["이름", "그룹"]},
+    "history": {"sheet": "history", "mode": "append", "indexes": ["발송일", "이름"]},
+    "production": {"sheet": "production", "mode": "append", "mutable": ["완성(개)", "폐기(병)", "비고", "상태"], "indexes": ["배치ID", "상태"]},
+    "ph_logs": {"sheet": "ph_logs", "mode": "append", "indexes": ["배치ID", "측정일시"]},
+}
+SHEET_TO_TABLE = {cfg["sheet"]: name for name, cfg in TABLES.items()}
+
+# 행 상태: 동기화됨 / 로컬에만 있음(전송 대기) / 전송됨(다음 동기화 때 시트 원본으로 교체)
+SYNCED, PENDING, SENT = 0, 1, 2
+
+
+def _q(name):
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def _col_letter(col):
+    return rowcol_to_a1(1, col)[:-1]
+
+
+def _values(row, width):
+    return [numericise(v) if isinstance(v, str) else v for v in list(row) + [""] * (width - len(row))][:width]
+
+
+class LocalTables:
+    # 시트와 같은 모양(헤더 + 행)의 SQLite 테이블 묶음
+    def __init__(self, path):
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._lock = threading.RLock()        # DB 접근
+        self._headers = {}
+        with self._db:
+            self._db.execute("CREATE TABLE IF NOT EXISTS sync_state (name TEXT PRIMARY KEY, header TEXT, synced_rows INTEGER, synced_at REAL)")
+        for name, header in self._db.execute("SELECT name, header FROM sync_state"):
+            self._headers[name] = json.loads(header)
+
+    # --- 테이블 ---
+    def _table(self, name):
+        return _q("t_" + name)
+
+    def _columns(self, header):
+        # 빈/중복 헤더는 위치 기반 이름으로 저장 (출력은 원래 헤더로)
+        seen, cols = set(), []
+        for i, h in enumerate(header):
+            c = h if h and h not in seen else f"_c{i}"
+            seen.add(c)
+            cols.append(c)
+        return cols
+
+    def _create(self, name, header):
+        cols = self._columns(header)
+        self._db.execute(f"DROP TABLE IF EXISTS {self._table(name)}")
+        self._db.execute(f"CREATE TABLE {self._table(name)} (_id INTEGER PRIMARY KEY AUTOINCREMENT, _row INTEGER UNIQUE, _state INTEGER DEFAULT 0, {', '.join(_q(c) for c in cols)})")
+        for col in TABLES[name].get("indexes", []):
+            if col in cols: self._db.execute(f"CREATE INDEX {_q(f'ix_{name}_{col}')} ON {self._table(name)} ({_q(col)})")
+        self._db.execute("INSERT OR REPLACE INTO sync_state VALUES (?, ?, 0, NULL)", (name, json.dumps(header, ensure_ascii=False)))
+        self._headers[name] = header
+
+    def _insert(self, name, rows, start_row=None, state=SYNCED):
+        header = self._headers[name]
+        cols = self._columns(header)
+        sql = f"INSERT INTO {self._table(name)} (_row, _state, {', '.join(_q(c) for c in cols)}) VALUES ({', '.join(['?'] * (len(cols) + 2))})"
+        ids = []
+        for i, row in enumerate(rows):
+            cur = self._db.execute(sql, [None if start_row is None else start_row + i, state] + _values(row, len(cols)))
+            ids.append(cur.lastrowid)
+        return ids
+
+    # --- 읽기 ---
+    def records(self, name, where="", params=(), offset=0):
+        # get_all_records() 와 같은 형태. where 는 인덱스 열 조건 (예: '"배치ID" = ?'), offset 은 건너뛸 행 수
+        with self._lock:
+            header = self._headers.get(name)
+            if header is None: return []
+            cols = self._columns(header)
+            sql = f"SELECT {', '.join(_q(c) for c in cols)} FROM {self._table(name)}"
+            if where: sql += f" WHERE {where}"
+            sql += " ORDER BY _row IS NULL, _row, _id"
+            if offset: sql += f" LIMIT -1 OFFSET {int(offset)}"
+            return [dict(zip(header, r)) for r in self._db.execute(sql, params)]
+
+    def _update_local(self, name, key, mutate, width):
+        # 첫 열(키)로 행을 찾아 mutate 적용. (변경, 수정 전 값) 또는 None
+        header = self._headers.get(name)
+        if header is None: return None
+        cols = self._columns(header)
+        row = self._db.execute(f"SELECT _id, {', '.join(_q(c) for c in cols)} FROM {self._table(name)} WHERE {_q(cols[0])} = ? ORDER BY _id DESC LIMIT 1", (key,)).fetchone()
+        if row is None: return None
+        current = list(row[1:]) + [""] * (width - len(cols))
+        changes = mutate(current)
+        if changes:
+            valid = {col: val for col, val in changes.items() if col <= len(cols)}
+            self._db.execute(f"UPDATE {self._table(name)} SET {', '.join(f'{_q(cols[col - 1])} = ?' for col in valid)} WHERE _id = ?", _values(list(valid.values()), len(valid)) + [row[0]])
+        return changes, current
+
+class SqliteBackend(LocalTables, Backend):
+    # 시트 없이 SQLite 파일만 쓰는 저장소. SheetMirror 가 만든 파일을 그대로 열 수도 있음
+    def read_records(self, title=None):
+        return self.records(SHEET_TO_TABLE[title])
+
+    def read_records_from(self, title, start):
+        return self.records(SHEET_TO_TABLE[title], offset=start)
+
+    def load(self, title, values):
+        # 시드 데이터: [헤더, 행, ...] 로 테이블을 통째로 교체
+        name = SHEET_TO_TABLE[title]
+        with self._lock, self._db:
+            self._create(name, values[0] if values else [])
+            self._insert(name, values[1:], start_row=2)
+            self._db.execute("UPDATE sync_state SET synced_rows = ?, synced_at = ? WHERE name = ?", (len(values[1:]), time.time(), name))
+
+    def append_rows(self, title, rows, header=None):
+        if not rows: return
+        name = SHEET_TO_TABLE[title]
+        with self._lock, self._db:
+            if name not in self._headers:
+                if header is None: raise KeyError(title)
+                self._create(name, header)
+            last = self._db.execute(f"SELECT COALESCE(MAX(_row), 1) FROM {self._table(name)}").fetchone()[0]
+            self._insert(name, rows, start_row=last + 1)
+
+    def update_row(self, title, key, mutate, width=10):
+        with self._lock, self._db:
+            return self._update_local(SHEET_TO_TABLE[title], key, mutate, width) is not None
+
+
+class SheetMirror(LocalTables, Backend):
+    def __init__(self, session, path, sync_interval=30, on_change=None):
+        super().__init__(path)
+        self.session = session
+        self.sync_interval = sync_interval
+        self.on_change = on_change
+        self.online = True
+        self._sync_lock = threading.RLock()   # 재전송/동기화 순서 보장
+        self._syncing = set()
+        with self._db:
+            self._db.execute("CREATE TABLE IF NOT EXISTS outbox (id INTEGER PRIMARY KEY AUTOINCREMENT, sheet TEXT, op TEXT, payload TEXT, created_at REAL, status TEXT DEFAULT 'pending', error TEXT)")
+
+    # --- 읽기 ---
+    def read_records(self, title=None):
+        return self.read_records_from(title, 0)
+
+    def read_records_from(self, title, start):
+        name = SHEET_TO_TABLE[title]
+        with self._lock:
+            state = self._db.execute("SELECT synced_at FROM sync_state WHERE name = ?", (name,)).fetchone()
+        if state is None or state[0] is None:
+            # 처음에는 동기화를 기다림 (오프라인이면 예외)
+            self.sync(name)
+        elif time.time() - state[0] > self.sync_interval:
+            self._sync_in_background(name)
+        return self.records(name, offset=start)
+
+    # --- 동기화 ---
+    def _sync_in_background(self, name):
+        with self._lock:
+            if name in self._syncing: return
+            self._syncing.add(name)
+        def _run():
+            try: self.sync(name)
+            except Exception: pass
+            finally:
+                with self._lock: self._syncing.discard(name)
+        threading.Thread(target=_run, daemon=True).start()
+
+    def sync(self, name, full=False):
+        with self._sync_lock:
+            self.flush()
+            try:
+                changed = self._pull(name, full)
+                self.online = True
+            except Exception as e:
+                if is_unavailable(e): self.online = False
+                raise
+        if changed and self.on_change: self.on_change(name)
+        return changed
+
+    def _pull(self, name, full):
+        cfg = TABLES[name]
+        header = self._headers.get(name)
+        if full or header is None or cfg["mode"] == "full":
+            values = self.session.run(cfg["sheet"], lambda ws: ws.get_all_values())
+            return self._pull_full(name, values)
+
+        # 마지막 동기화 이후 추가된 행 + 수정 가능한 열만 batch_get 한 번으로
+        with self._lock:
+            n = self._db.execute("SELECT synced_rows FROM sync_state WHERE name = ?", (name,)).fetchone()[0]
+        width = len(header)
+        ranges = [f"A{n + 2}:{_col_letter(width)}"]
+        mutable = [header.index(c) for c in cfg.get("mutable", []) if c in header]
+        if mutable and n > 0:
+            lo, hi = min(mutable), max(mutable)
+            ranges.append(f"{_col_letter(lo + 1)}2:{_col_letter(hi + 1)}{n + 1}")
+        res = self.session.run(cfg["sheet"], lambda ws: ws.batch_get(ranges))
+        new_rows = list(res[0])
+        changed = False
+        with self._lock, self._db:
+            # 전송했던 로컬 행은 시트 원본이 들어오므로 정리
+            if new_rows:
+                self._db.execute(f"DELETE FROM {self._table(name)} WHERE _state = ?", (SENT,))
+                self._insert(name, new_rows, start_row=n + 2)
+                changed = True
+            if len(ranges) > 1:
+                cols = self._columns(header)[lo:hi + 1]
+                local = {r[0]: list(r[1:]) for r in self._db.execute(f"SELECT _row, {', '.join(_q(c) for c in cols)} FROM {self._table(name)} WHERE _row IS NOT NULL AND _row <= ?", (n + 1,))}
+                for i, row in enumerate(res[1]):
+                    remote = _values(row, len(cols))
+                    if local.get(i + 2) != remote:
+                        self._db.execute(f"UPDATE {self._table(name)} SET {', '.join(f'{_q(c)} = ?' for c in cols)} WHERE _row = ?", remote + [i + 2])
+                        changed = True
+                # 뒤쪽 빈 행은 batch_get 결과에서 잘리므로 비워 줌
+                for r in range(len(res[1]) + 2, n + 2):
+                    if any(v != "" for v in local.get(r, [])):
+                        self._db.execute(f"UPDATE {self._table(name)} SET {', '.join(f'{_q(c)} = ?' for c in cols)} WHERE _row = ?", [""] * len(cols) + [r])
+                        changed = True
+            self._db.execute("UPDATE sync_state SET synced_rows = ?, synced_at = ? WHERE name = ?", (n + len(new_rows), time.time(), name))
+        return changed
+
+    def _pull_full(self, name, values):
+        header, rows = (values[0], values[1:]) if values else ([], [])
+        with self._lock, self._db:
+            if header != self._headers.get(name):
+                self._create(name, header)
+            cols = self._columns(header)
+            local = {r[0]: list(r[1:]) for r in self._db.execute(f"SELECT _row, {', '.join(_q(c) for c in cols)} FROM {self._table(name)} WHERE _row IS NOT NULL")} if cols else {}
+            changed = False
+            self._db.execute(f"DELETE FROM {self._table(name)} WHERE _state = ?", (SENT,))
+            for i, row in enumerate(rows):
+                remote = _values(row, len(cols))
+                if i + 2 not in local: self._insert(name, [row], start_row=i + 2)
+                elif local[i + 2] != remote:
+                    self._db.execute(f"UPDATE {self._table(name)} SET {', '.join(f'{_q(c)} = ?' for c in cols)} WHERE _row = ?", remote + [i + 2])
+                else: continue
+                changed = True
+            if len(local) > len(rows):
+                self._db.execute(f"DELETE FROM {self._table(name)} WHERE _row > ?", (len(rows) + 1,))
+                changed = True
+            self._db.execute("UPDATE sync_state SET synced_rows = ?, synced_at = ? WHERE name = ?", (len(rows), time.time(), name))
+        return changed
+
+    # --- 쓰기 (로컬 반영 + outbox) ---
+    def append_rows(self, title, rows, header=None):
+        rows = [list(r) for r in rows]
+        if not rows: return
+        name = SHEET_TO_TABLE[title]
+        with self._lock, self._db:
+            if name not in self._headers:
+                # 시트를 한 번도 못 받아온 상태: 시트에 만들 헤더 기준으로 로컬 테이블 생성
+                self._create(name, header)
+            ids = self._insert(name, rows, state=PENDING)
+            payload = {"rows": rows, "header": header, "ids": ids}
+            self._db.execute("INSERT INTO outbox (sheet, op, payload, created_at) VALUES (?, 'append', ?, ?)", (name, json.dumps(payload, ensure_ascii=False), time.time()))
+        self._flush_quietly()
+
+    def update_row(self, title, key, mutate, width=10):
+        # 로컬 행으로 읽기-수정-쓰기 후, 재전송 시 시트 값이 로컬에서 본 값과 같은지 다시 확인
+        name = SHEET_TO_TABLE[title]
+        with self._lock, self._db:
+            found = self._update_local(name, key, mutate, width)
+            if not found: return False
+            changes, current = found
+            if changes:
+                payload = {"key": key, "width": width, "changes": {str(c): v for c, v in changes.items()}, "expected": {str(c): current[c - 1] for c in changes}}
+                self._db.execute("INSERT INTO outbox (sheet, op, payload, created_at) VALUES (?, 'update', ?, ?)", (name, json.dumps(payload, ensure_ascii=False), time.time()))
+        self._flush_quietly()
+        return True
+
+    # --- 재전송 ---
+    def _flush_quietly(self):
+        try: self.flush()
+        except Exception: pass
+
+    def flush(self):
+        # outbox 를 순서대로 시트에 반영. 연결이 끊기면 멈추고 남은 것은 다음 기회에
+        sent = 0
+        with self._sync_lock:
+            with self._lock:
+                entries = self._db.execute("SELECT id, sheet, op, payload FROM outbox WHERE status = 'pending' ORDER BY id").fetchall()
+            for entry_id, name, op, payload in entries:
+                payload = json.loads(payload)
+                title = TABLES[name]["sheet"]
+                try:
+                    if op == "append":
+                        self.session.append_rows(title, payload["rows"], header=payload["header"])
+                    else:
+                        self.session.update_row(title, payload["key"], _checked(payload), width=payload["width"])
+                    status, error = None, None
+                except RowConflict as e: status, error = "conflict", f"다른 곳에서 먼저 수정됨: {e}"
+                except Exception as e:
+                    if is_unavailable(e):
+                        self.online = False
+                        break
+                    status, error = "failed", str(e)
+                self.online = True
+                with self._lock, self._db:
+                    if status is None:
+                        self._db.execute("DELETE FROM outbox WHERE id = ?", (entry_id,))
+                        if op == "append":
+                            self._db.execute(f"UPDATE {self._table(name)} SET _state = ? WHERE _id IN ({', '.join('?' * len(payload['ids']))})", [SENT] + payload["ids"])
+                        sent += 1
+                    else: self._db.execute("UPDATE outbox SET status = ?, error = ? WHERE id = ?", (status, error, entry_id))
+        return sent
+
+    def outbox(self):
+        with self._lock:
+            rows = self._db.execute("SELECT id, sheet, op, status, error, created_at FROM outbox ORDER BY id").fetchall()
+        return [{"id": r[0], "sheet": r[1], "op": r[2], "status": r[3], "error": r[4], "created_at": r[5]} for r in rows]
+
+
+def _checked(payload):
+    # 재전송용 mutate: 시트의 현재 값이 로컬에서 수정 전에 본 값과 다르면 충돌
+    def mutate(row):
+        for col, expected in payload["expected"].items():
+            actual = row[int(col) - 1]
+            if (numericise(actual) if isinstance(actual, str) else actual) != (numericise(expected) if isinstance(expected, str) else expected):
+                raise RowConflict(payload["key"])
+        return {int(c): v for c, v in payload["changes"].items()}
+    return mutate
@@ -0,0 +1,224 @@
+# 주문/배송 계산 (Streamlit 에 의존하지 않는 순수 함수 - app.py 와 벤치마크에서 같이 사용)
+import collections
+import threading
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from bom import RecipeCycleError, explode, recipe_key
+from catalog import ALIASES, CATALOG, OrderTable
+from schedule import parse_start_dates, round_index
+
+
+def _lookup(keys, mapping, default):
+    # 문자열 배열을 dict 로 치환 (index_in + take, 파이썬 루프 없음). 없는 키는 default(스칼라 또는 같은 길이 배열)
+    idx = pc.index_in(keys, value_set=pa.array(list(mapping), pa.string()))
+    return pc.fill_null(pc.take(pa.array(list(mapping.values()), pa.string()), idx), default)
+
+
+def _split_orders(texts):
+    # 주문내역 문자열 목록 -> 항목별 Arrow 배열 (행, 항목, 제품, 수량, 사유)
+    # 문자열 처리는 모두 Arrow 커널에서 한 번에 (pandas 의 split(expand=True)/extract 는 파이썬 루프로 떨어짐)
+    lists = pc.split_pattern(pa.array(texts, pa.string()), ",")
+    rows = pc.list_parent_indices(lists)
+    items = pc.utf8_trim_whitespace(pc.list_flatten(lists))
+    keep = pc.not_equal(items, "")
+    items, rows = pc.filter(items, keep), pc.filter(rows, keep)
+
+    parts = pc.extract_regex(items, r"^(?P<p>[^:]*):(?P<q>[^:]*)$")
+    product = pc.fill_null(pc.utf8_trim_whitespace(pc.struct_field(parts, "p")), "")
+    product = _lookup(product, ALIASES, product)
+    qty = pc.replace_substring_regex(pc.fill_null(pc.utf8_trim_whitespace(pc.struct_field(parts, "q")), ""), r"^\+", "")
+    reason = pc.case_when(
+        pc.make_struct(pc.is_null(parts), pc.equal(product, ""), pc.invert(pc.match_substring_regex(qty, r"^-?[0-9]{1,9}$"))),
+        pc.if_else(pc.match_substring(items, ":"), "형식 오류(':' 가 두 개 이상)", "형식 오류(제품:수량 아님)"),
+        "제품명 없음", "수량이 정수가 아님")
+    ok = pc.is_null(reason)
+    bad = pc.invert(ok)
+    product = pc.filter(product, ok)
+    return {
+        "rows": pc.filter(rows, ok), "product": product, "qty": pc.cast(pc.filter(qty, ok), pa.int64()),
+        "bad_rows": pc.filter(rows, bad), "bad_items": pc.filter(items, bad), "reasons": pc.filter(reason, bad),
+    }
+
+
+def _error_frame(names, split):
+    # 잘못된 주문 항목 표. "행" 은 환자 목록에서의 순서
+    names = pa.array(names)
+    return pa.table({
+        "행": split["bad_rows"], "환자": pc.take(names, split["bad_rows"]), "항목": split["bad_items"], "사유": split["reasons"],
+    }).to_pandas()
+
+
+def _rounds(values):
+    # 회차: "3회", "3주", "3" -> 3, 비었거나 숫자가 아니면 1
+    text = pc.utf8_trim_whitespace(pc.replace_substring_regex(pa.array(values, pa.string()), "[회주]", ""))
+    text = pc.replace_substring_regex(text, r"^\+", "")
+    return pc.cast(pc.if_else(pc.match_substring_regex(text, r"^-?[0-9]{1,9}$"), text, "1"), pa.int64()).to_pylist()
+
+
+def parse_patients(data):
+    # get_all_records() 결과 -> {"db": {이름: {...}}, "orders": 정규화된 주문표(OrderTable), "errors": 잘못된 주문 항목}
+    data = [r for r in data if str(r.get('이름', '')).strip()]
+    split = _split_orders([str(r.get('주문내역', '')) for r in data])
+    rounds = _rounds([str(r.get('회차', '')) for r in data])
+    starts_raw = [str(r.get('시작일', '')).strip() for r in data]
+    starts, bad_starts = parse_start_dates(starts_raw)
+
+    # 제품명은 고유한 것만 카탈로그 id 로 바꾸고, 주문은 행 순서대로인 (id, 수량) 배열을 환자별 구간으로 나눔
+    enc = pc.dictionary_encode(split["product"])
+    lut = CATALOG.intern_all(enc.dictionary.to_pylist())
+    ids = lut[enc.indices.to_numpy(zero_copy_only=False)] if len(lut) else np.zeros(0, dtype=np.int32)
+    names = [str(r['이름']) for r in data]
+    orders = OrderTable(split["rows"].to_numpy(zero_copy_only=False), ids, split["qty"].to_numpy(zero_copy_only=False), names)
+    items_by_row = orders.split()
+
+    bad_set = set(bad_starts)
+    db = {}
+    for i, (r, items, round_num, raw, start) in enumerate(zip(data, items_by_row, rounds, starts_raw, starts)):
+        db[r['이름']] = {
+            "group": r.get('그룹', ''), "note": r.get('비고', ''), "default": str(r.get('기본발송', '')).upper() == 'O',
+            "items": items, "round": round_num, "start_date_raw": raw, "start_date": start, "start_date_error": i in bad_set,
+        }
+    errors = _error_frame(names, split)
+    if bad_starts:
+        start_errors = pd.DataFrame({"행": bad_starts, "환자": [names[i] for i in bad_starts],
+                                     "항목": [starts_raw[i] for i in bad_starts], "사유": "시작일 형식 오류"})
+        errors = pd.concat([errors, start_errors], ignore_index=True)
+    return {"db": db, "orders": orders, "errors": errors}
+
+
+def parse_patient_rows(data):
+    return parse_patients(data)["db"]
+
+
+# --- 발송 탭 집계 (sel_p: {이름: {'items', 'group', 'round'}}) ---
+# 선택된 환자의 주문을 한 번만 훑어 (제품, 용량)별 합계표를 만들고, 그 표에서
+# 장연구원 포장 합계, 한책임 혼합 수요/재료 합계, 커드 수요량을 모두 계산.
+# 결과는 (날짜, 선택 환자, 레시피) 키로 메모 -> 관계없는 위젯을 눌러 rerun 돼도 다시 계산하지 않음
+ROLLUP_MEMO_SIZE = 32
+CURD_GRAMS = {"계란 커드": 150, "커드": 150, "커드 시원한 것": 40}
+_rollup_memo = collections.OrderedDict()
+_rollup_lock = threading.Lock()
+
+
+def selection_key(sel_p, target_date=None, recipes=None):
+    # items(OrderItems) 는 환자 DB 를 읽을 때마다 새로 만들어지고 이후 수정하지 않으므로 id 로 구분
+    # (메모 항목이 items 를 붙잡고 있어서 살아 있는 동안 id 가 재사용되지 않음)
+    return (str(target_date), recipe_key(recipes), tuple((name, info.get('round'), id(info['items'])) for name, info in sel_p.items()))
+
+
+def _rollups(sel_p, recipes):
+    packing, mixed, curd = {}, {}, {"curd_pure": 0, "curd_cool": 0}
+    qty, count = OrderTable.of(sel_p).totals()
+    for pid in np.flatnonzero(count).tolist():
+        p, cap, q = CATALOG.names[pid], CATALOG.caps[pid], int(qty[pid])
+        if CATALOG.mixed[pid]:
+            mixed[p] = mixed.get(p, 0) + q
+            continue
+        k = f"{p} {cap}" if cap else p
+        packing[k] = packing.get(k, 0) + q
+        if p in CURD_GRAMS: curd["curd_cool" if p == "커드 시원한 것" else "curd_pure"] += q
+    curd["total_kg"] = (curd["curd_cool"] * CURD_GRAMS["커드 시원한 것"] + curd["curd_pure"] * CURD_GRAMS["계란 커드"]) / 1000
+    curd["milk"] = (curd["total_kg"] / 9) * 16  # 우유 9kg 당 16통
+    try: bom = explode(mixed, recipes or {})
+    except RecipeCycleError as e: bom = {"raw": {}, "intermediate": {}, "missing": [], "error": str(e)}
+    return {"packing": packing, "mixed": mixed, "materials": bom["raw"], "bom": bom, "curd": curd}
+
+
+def shipping_rollups(sel_p, target_date=None, recipes=None):
+    # -> {"packing": {제품 용량: 수량}, "mixed": {혼합 제품: 수량}, "materials": {원재료: 양}, "bom": 전개 결과, "curd": {...}}
+    # 돌려주는 dict 는 메모와 공유되므로 호출한 쪽에서 수정하지 않음
+    key = selection_key(sel_p, target_date, recipes)
+    with _rollup_lock:
+        hit = _rollup_memo.get(key)
+        if hit is not None:
+            _rollup_memo.move_to_end(key)
+            return hit[0]
+    result = _rollups(sel_p, recipes)
+    with _rollup_lock:
+        _rollup_memo[key] = (result, [info['items'] for info in sel_p.values()])
+        while len(_rollup_memo) > ROLLUP_MEMO_SIZE: _rollup_memo.popitem(last=False)
+    return result
+
+
+def recipe_materials(recipe, qty):
+    # 레시피 1건을 qty 만큼 만들 때의 재료 [(재료, 수량 또는 설명 문자열)]
+    ratio = qty / recipe['batch_size'] if recipe['batch_size'] > 1 else qty
+    return [(m, mq * ratio if isinstance(mq, (int, float)) else mq) for m, mq in recipe['materials'].items()]
+
+
+# --- 앞으로 N 주 수요 예측 (체크 여부와 관계없이 전체 환자) ---
+# (날짜, 환자) 발송 여부 행렬(RoundIndex) x (환자, 제품) 주문 수량 행렬 -> (날짜, 제품) 수요를 행렬 곱 한 번으로.
+# 발송 예정일이 발송 불가일(금/주말/휴일)이면 다음 발송 가능일로 미룸. 결과는 (환자 DB, 시작일, 주 수) 키로 메모
+PROJECTION_MEMO_SIZE = 8
+_order_matrix = {}
+_projection_memo = collections.OrderedDict()
+_projection_lock = threading.Lock()
+
+
+def order_matrix(db):
+    # 환자 DB -> (환자, 제품 id) 주문 수량 행렬. 같은 환자 DB 객체면 재사용 (db 참조를 같이 들고 있음)
+    hit = _order_matrix.get("db")
+    if hit is None or hit[0] is not db:
+        items = [v['items'] for v in db.values()]
+        m = np.zeros((len(items), len(CATALOG)), dtype=np.float32)
+        if items:
+            rows = np.repeat(np.arange(len(items)), [len(i) for i in items])
+            np.add.at(m, (rows, np.concatenate([i.ids for i in items])), np.concatenate([i.qty for i in items]))
+        _order_matrix["db"] = hit = (db, m)
+    return hit[1]
+
+
+def _projection(db, start, weeks, calendar):
+    ri, qty = round_index(db), order_matrix(db)
+    start = np.datetime64(pd.Timestamp(start).date(), "D")  # datetime(시간대 포함)도 날짜로
+    end = start + 7 * weeks
+    # 기간 직전 며칠의 발송도 불가일이면 기간 안으로 밀려 들어오므로 한 주 앞부터 계산
+    first = start - (7 if calendar else 0)
+    days = np.arange(first, end, dtype="datetime64[D]")
+    due = ri.deliveries(first.item(), len(days))
+    demand = due.astype(np.float32) @ qty
+    if calendar is not None:
+        valid = np.array(calendar.valid_between(days[0].item(), (end + 31).item()), dtype="datetime64[D]")
+        if len(valid): days = valid[np.minimum(np.searchsorted(valid, days), len(valid) - 1)]
+    keep = (days >= start) & (days < end)
+    days, demand, patients = days[keep], demand[keep], int(due[keep].any(axis=0).sum())
+
+    grams = np.zeros(qty.shape[1])
+    for name, g in CURD_GRAMS.items(): grams[CATALOG.intern(name)] = g
+    totals_ = demand.sum(axis=0)
+    cols = [pid for pid in np.argsort(-totals_, kind="stable").tolist() if totals_[pid]]
+    names = [CATALOG.names[pid] for pid in cols]
+
+    daily = pd.DataFrame(demand[:, cols], columns=names).astype(np.int64)
+    daily["커드(kg)"] = demand @ grams / 1000
+    daily.insert(0, "날짜", pd.to_datetime(days).date)
+    daily = daily.groupby("날짜", sort=True).sum()
+    daily = daily[daily.any(axis=1)]
+    daily["우유(통)"] = (daily["커드(kg)"] / 9 * 16).round(1)  # 우유 9kg 당 16통
+
+    week = ((pd.to_datetime(daily.index) - pd.Timestamp(start)).days // 7).to_numpy()
+    weekly = daily.drop(columns="우유(통)").groupby(week).sum().reindex(range(weeks), fill_value=0)
+    weekly.index = [f"{k + 1}주차 ({(start + 7 * k).item():%m/%d}~)" for k in weekly.index]
+    weekly["우유(통)"] = np.ceil(weekly["커드(kg)"] / 9 * 16).astype(np.int64)
+    daily["커드(kg)"], weekly["커드(kg)"] = daily["커드(kg)"].round(2), weekly["커드(kg)"].round(2)
+    return {"daily": daily, "weekly": weekly, "patients": patients}
+
+
+def demand_projection(db, start, weeks, calendar=None):
+    # -> {"daily": 날짜별 DataFrame, "weekly": 주차별 DataFrame, "patients": 기간 안에 발송이 있는 환자 수}
+    #    열: 제품별 수량(많은 순) + "커드(kg)" + "우유(통)". 돌려주는 값은 메모와 공유되므로 수정하지 않음
+    key = (id(db), str(start), int(weeks), id(calendar))
+    with _projection_lock:
+        hit = _projection_memo.get(key)
+        if hit is not None:
+            _projection_memo.move_to_end(key)
+            return hit[0]
+    result = _projection(db, start, int(weeks), calendar)
+    with _projection_lock:
+        _projection_memo[key] = (result, db, calendar)
+        while len(_projection_memo) > PROJECTION_MEMO_SIZE: _projection_memo.popitem(last=False)
+    return result
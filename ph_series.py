@@ -0,0 +1,291 @@
+# 배치별 pH 시계열
+# - ph_logs 시트를 배치ID 별로 나눠 측정 시각 순으로 정렬된 배열(분 단위 시각, pH, 온도)로 보관
+# - 구간 조회는 이분 탐색, 차트용 다운샘플링은 시간 구간 평균
+# - 배치별 집계(최근 pH, 최저/최고, 일평균 측정 수)는 새 측정이 들어올 때마다 갱신해 두고 조회만 함
+#   새 측정은 여유 용량이 있는 배열 끝에 붙임 (배열 전체를 복사하지 않음)
+# - 종료 예측: 배치별 지수 가중 선형 추세(최근 측정일수록 가중)를 합계 5개로 유지 -> 새 측정마다 O(1) 갱신
+#   목표 구간(연간 일정 비고의 "동백꽃 pH 3.8~4.0")에 들어가는 시각을 추세선으로 계산
+import math
+import re
+import threading
+
+import numpy as np
+import pandas as pd
+
+TIME_FORMAT = "%Y-%m-%d %H:%M"
+HALFLIFE_HOURS = 24  # 추세 가중치가 절반이 되는 시간
+_TARGET = re.compile(r"(?:([^\s,·/]+)\s*)?pH\s*(\d+(?:\.\d+)?)\s*[~∼\-]\s*(\d+(?:\.\d+)?)")
+
+
+def _minutes(values):
+    # "YYYY-MM-DD HH:MM" -> 1970 기준 분 (형식이 다르면 None 대신 NaT -> 제외)
+    t = pd.to_datetime(pd.Series(values, dtype=object).astype(str), format=TIME_FORMAT, errors="coerce")
+    ok = t.notna().to_numpy()
+    return t.to_numpy(dtype="datetime64[m]").astype(np.int64), ok
+
+
+def _point(v):
+    # date/datetime/문자열 -> 1970 기준 분
+    return int(np.datetime64(pd.Timestamp(v), "m").astype(np.int64))
+
+
+def _float(v):
+    try: return float(v)
+    except (TypeError, ValueError): return np.nan
+
+
+class _Trend:
+    # 지수 가중 최소제곱 pH = a + b·h (h: 마지막 측정 기준 시간). 합계 W, T, Y, TT, TY 만 보관
+    def __init__(self, times, ph, decay):
+        self.decay = decay
+        m = ~np.isnan(ph)
+        self.n = int(m.sum())
+        self.last = int(times[m][-1]) if self.n else None
+        if not self.n:
+            self.W = self.T = self.Y = self.TT = self.TY = 0.0
+            return
+        h = (times[m] - self.last) / 60
+        w = np.exp(decay * h)
+        y = ph[m]
+        self.W, self.T, self.Y = float(w.sum()), float((w * h).sum()), float((w * y).sum())
+        self.TT, self.TY = float((w * h * h).sum()), float((w * h * y).sum())
+
+    def add(self, t, ph):
+        if np.isnan(ph): return
+        self.n += 1
+        if self.last is None: self.last = t
+        d = (t - self.last) / 60
+        if d > 0:
+            # 기준 시각을 새 측정으로 옮기고(h -> h - d) 기존 합계를 감쇠
+            k = math.exp(-self.decay * d)
+            self.TT = k * (self.TT - 2 * d * self.T + d * d * self.W)
+            self.TY = k * (self.TY - d * self.Y)
+            self.T = k * (self.T - d * self.W)
+            self.W, self.Y = k * self.W, k * self.Y
+            self.last, d = t, 0.0
+        w = math.exp(self.decay * d)  # 늦게 들어온 과거 측정은 그만큼 작은 가중치
+        self.W += w; self.T += w * d; self.Y += w * ph
+        self.TT += w * d * d; self.TY += w * d * ph
+
+    def fit(self):
+        # -> (마지막 측정 시각의 추세 pH, 시간당 변화량) 또는 None (측정 2개 미만/같은 시각뿐)
+        den = self.W * self.TT - self.T * self.T
+        if self.n < 2 or den <= 1e-12 * max(self.W, 1) ** 2: return None
+        b = (self.W * self.TY - self.T * self.Y) / den
+        return (self.Y - b * self.T) / self.W, b
+
+
+def _buffer(values, cap):
+    # values 를 앞에 담은 용량 cap 배열 (뒤는 새 측정용 여유 공간)
+    buf = np.empty(max(16, cap), dtype=values.dtype)
+    buf[:len(values)] = values
+    return buf
+
+
+class _Series:
+    # 측정은 여유 용량을 둔 배열(용량이 차면 2배로 늘림)에 시각 순으로 보관하고 앞의 n 개만 사용
+    def __init__(self, times, ph, temp, decay=math.log(2) / HALFLIFE_HOURS):
+        order = np.argsort(times, kind="stable")
+        times, ph, temp = times[order], ph[order], temp[order]
+        self.n = n = len(times)
+        self._t, self._p, self._c = _buffer(times, 2 * n), _buffer(ph, 2 * n), _buffer(temp, 2 * n)
+        valid = ph[~np.isnan(ph)]
+        self.min = float(valid.min()) if len(valid) else None
+        self.max = float(valid.max()) if len(valid) else None
+        days, counts = np.unique(times // 1440, return_counts=True)
+        self.per_day = dict(zip(days.tolist(), counts.tolist()))
+        self.trend = _Trend(times, ph, decay)
+
+    @property
+    def times(self):
+        return self._t[:self.n]
+
+    @property
+    def ph(self):
+        return self._p[:self.n]
+
+    @property
+    def temp(self):
+        return self._c[:self.n]
+
+    def _grow(self):
+        self._t, self._p, self._c = (_buffer(b[:self.n], 2 * len(b)) for b in (self._t, self._p, self._c))
+
+    def add(self, t, ph, temp):
+        n = self.n
+        if n == len(self._t): self._grow()
+        if not n or t >= self._t[n - 1]:
+            # 보통은 시간 순으로 들어오므로 끝에 붙이고 추세 합계만 갱신 -> O(1)
+            self._t[n], self._p[n], self._c[n] = t, ph, temp
+            self.n += 1
+            self.trend.add(t, ph)
+        else:
+            # 늦게 들어온 과거 측정: 제자리에 끼워 넣고 추세를 다시 계산
+            i = int(np.searchsorted(self._t[:n], t, side="right"))
+            for buf, v in ((self._t, t), (self._p, ph), (self._c, temp)):
+                buf[i + 1:n + 1] = buf[i:n]
+                buf[i] = v
+            self.n += 1
+            self.trend = _Trend(self.times, self.ph, self.trend.decay)
+        if not np.isnan(ph):
+            self.min = ph if self.min is None else min(self.min, ph)
+            self.max = ph if self.max is None else max(self.max, ph)
+        self.per_day[t // 1440] = self.per_day.get(t // 1440, 0) + 1
+
+    def forecast(self, band, now):
+        # band (하한, 상한) 에 들어가는 시각 예측. now: 1970 기준 분
+        lo, hi = band
+        last = self.ph[~np.isnan(self.ph)]
+        if not len(last): return {"상태": "측정 없음"}
+        cur = float(last[-1])
+        fit = self.trend.fit()
+        out = {"최근 pH": cur, "추세(pH/일)": round(fit[1] * 24, 3) if fit else None}
+        if cur < lo: return dict(out, 상태="목표 이하")
+        if cur <= hi: return dict(out, 상태="목표 도달")
+        if not fit: return dict(out, 상태="측정 부족")
+        if fit[1] >= 0: return dict(out, 상태="하강 없음")
+        a, b = fit
+        eta = self.trend.last + max((hi - a) / b, 0.0) * 60
+        return dict(out, 상태="도달 예상", **{"예상 도달": _fmt(eta), "남은 시간(h)": round((eta - now) / 60, 1)})
+
+    def summary(self):
+        last = len(self.times) - 1
+        return {
+            "측정 수": len(self.times),
+            "첫 측정": _fmt(self.times[0]) if len(self.times) else None,
+            "최근 측정": _fmt(self.times[last]) if len(self.times) else None,
+            "최근 pH": float(self.ph[last]) if len(self.times) else None,
+            "최저 pH": self.min, "최고 pH": self.max,
+            "일평균 측정": round(len(self.times) / len(self.per_day), 1) if self.per_day else 0,
+        }
+
+
+def _fmt(minutes):
+    return str(np.datetime64(int(minutes), "m")).replace("T", " ")
+
+
+def parse_targets(schedule):
+    # 연간 일정 {월: {"main": [...], "note": "동백꽃 pH 3.8~4.0 도달 시 종료"}} -> {원재료: (하한, 상한)}
+    # 비고에 원재료 이름 없이 "pH 3.8~4.0" 만 있으면 그 달 주요 품목 전체에 적용
+    targets = {}
+    for month in schedule.values():
+        for name, lo, hi in _TARGET.findall(month.get("note") or ""):
+            lo, hi = sorted((float(lo), float(hi)))
+            for n in ([name] if name else month.get("main", [])): targets[n] = (lo, hi)
+    return targets
+
+
+def match_target(material, targets):
+    # 배치 원재료 이름에 목표 품목 이름이 들어 있으면 그 목표 (긴 이름 우선)
+    material = str(material or "")
+    hits = [n for n in targets if n and n in material]
+    return targets[max(hits, key=len)] if hits else None
+
+
+class PhSeriesStore:
+    def __init__(self, records=(), halflife=HALFLIFE_HOURS):
+        self._lock = threading.Lock()
+        self._series = {}
+        self._decay = math.log(2) / halflife
+        records = list(records)
+        if not records: return
+        df = pd.DataFrame(records)
+        times, ok = _minutes(df['측정일시'])
+        ph = pd.to_numeric(df['pH'], errors="coerce").to_numpy(dtype=float)
+        temp = pd.to_numeric(df.get('온도', pd.Series(np.nan, index=df.index)), errors="coerce").to_numpy(dtype=float)
+        ids = df['배치ID'].astype(str).to_numpy()[ok]
+        times, ph, temp = times[ok], ph[ok], temp[ok]
+        # 배치ID 로 정렬해서 배치별 구간을 한 번에 자름
+        order = np.argsort(ids, kind="stable")
+        ids, times, ph, temp = ids[order], times[order], ph[order], temp[order]
+        uniq, starts = np.unique(ids, return_index=True)
+        bounds = list(starts) + [len(ids)]
+        for k, bid in enumerate(uniq.tolist()):
+            sl = slice(bounds[k], bounds[k + 1])
+            self._series[bid] = _Series(times[sl], ph[sl], temp[sl], self._decay)
+
+    def apply(self, change):
+        # CacheRegistry on_write 훅: 새 측정만 해당 배치에 끼워 넣음 (행 수정은 전체 다시 읽기)
+        if "append" not in change: return None
+        with self._lock:
+            for rec in change["append"]:
+                t, ok = _minutes([rec.get('측정일시')])
+                if not ok[0]: continue
+                bid = str(rec.get('배치ID'))
+                ph, temp = _float(rec.get('pH')), _float(rec.get('온도'))
+                if bid in self._series: self._series[bid].add(int(t[0]), ph, temp)
+                else: self._series[bid] = _Series(t[:1], np.array([ph]), np.array([temp]), self._decay)
+        return self
+
+    def batches(self):
+        with self._lock: return list(self._series)
+
+    def readings(self, batch_id, start=None, end=None):
+        # start <= 측정일시 <= end 인 측정 DataFrame (측정일시, pH, 온도)
+        with self._lock:
+            s = self._series.get(str(batch_id))
+            if s is None: return pd.DataFrame(columns=["측정일시", "pH", "온도"])
+            lo = np.searchsorted(s.times, _point(start)) if start is not None else 0
+            hi = np.searchsorted(s.times, _point(end), side="right") if end is not None else len(s.times)
+            return pd.DataFrame({"측정일시": s.times[lo:hi].astype("datetime64[m]"), "pH": s.ph[lo:hi], "온도": s.temp[lo:hi]})
+
+    def downsampled(self, batch_id, start=None, end=None, max_points=200):
+        # 차트용: 측정이 max_points 보다 많으면 같은 시간 폭 구간으로 나눠 평균
+        df = self.readings(batch_id, start, end)
+        if len(df) <= max_points: return df
+        t = df["측정일시"].to_numpy().astype("datetime64[m]").astype(np.int64)
+        edges = np.linspace(t[0], t[-1] + 1, max_points + 1)
+        b = np.searchsorted(edges, t, side="right") - 1
+        n = np.bincount(b, minlength=max_points)
+        keep = n > 0
+        out = {"측정일시": (np.bincount(b, weights=t, minlength=max_points)[keep] / n[keep]).astype(np.int64).astype("datetime64[m]")}
+        for col in ("pH", "온도"):
+            v = df[col].to_numpy(dtype=float)
+            m = ~np.isnan(v)
+            cnt = np.bincount(b[m], minlength=max_points)[keep]
+            with np.errstate(invalid="ignore", divide="ignore"):
+                out[col] = np.bincount(b[m], weights=v[m], minlength=max_points)[keep] / cnt
+        return pd.DataFrame(out)
+
+    def summary(self, batch_id):
+        with self._lock:
+            s = self._series.get(str(batch_id))
+            return s.summary() if s else None
+
+    def daily_counts(self, batch_id):
+        # {날짜: 측정 수}
+        with self._lock:
+            s = self._series.get(str(batch_id))
+            return {str(np.datetime64(d, "D")): n for d, n in sorted(s.per_day.items())} if s else {}
+
+    def summaries(self, batch_ids=None):
+        # 배치별 집계표 (최근 측정 순)
+        with self._lock:
+            ids = list(self._series) if batch_ids is None else [str(b) for b in batch_ids if str(b) in self._series]
+            df = pd.DataFrame([{"배치ID": b, **self._series[b].summary()} for b in ids])
+        return df.sort_values("최근 측정", ascending=False, ignore_index=True) if not df.empty else df
+
+    def forecast(self, batch_id, band, now):
+        with self._lock:
+            s = self._series.get(str(batch_id))
+            return s.forecast(band, _point(now)) if s else {"상태": "측정 없음"}
+
+    def urgency(self, batches, targets, now):
+        # 진행 중 배치 [(배치ID, 원재료)] -> 종료가 급한 순서 DataFrame
+        # 목표 이하(지나침) > 목표 도달 > 도달 예상(남은 시간 순) > 하강 없음 > 측정 부족/없음 > 목표 없음
+        rank = {"목표 이하": 0, "목표 도달": 1, "도달 예상": 2, "하강 없음": 3, "측정 부족": 4, "측정 없음": 5, "목표 없음": 6}
+        t = _point(now)
+        rows = []
+        with self._lock:
+            for bid, material in batches:
+                band = match_target(material, targets)
+                s = self._series.get(str(bid))
+                if band is None: f = {"상태": "목표 없음"}
+                elif s is None: f = {"상태": "측정 없음"}
+                else: f = s.forecast(band, t)
+                rows.append({"배치ID": bid, "원재료": material, "목표 pH": f"{band[0]}~{band[1]}" if band else "", **f})
+        cols = ["배치ID", "원재료", "목표 pH", "최근 pH", "추세(pH/일)", "상태", "예상 도달", "남은 시간(h)"]
+        df = pd.DataFrame(rows, columns=cols)
+        if df.empty: return df
+        key = df["상태"].map(rank) * 1e9 + pd.to_numeric(df["남은 시간(h)"], errors="coerce").fillna(0)
+        return df.iloc[key.argsort(kind="stable")].reset_index(drop=True)
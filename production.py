@@ -0,0 +1,70 @@
+# 생산 배치 상태
+# - 커드 배치의 상태 열(JSON: total/meta/sep/fail/done)은 생산 시트를 읽을 때 한 번만 풀어서 정수 열로 보관
+# - 진행 중인 배치(대사중/분리중 커드, 상태 '진행중' 일반 배치)는 따로 색인해 두고,
+#   시트 쓰기(추가/행 수정)가 생기면 바뀐 배치만 다시 분류 -> 화면은 진행 중인 배치 수만큼만 비용
+import json
+import threading
+
+CURD_FIELDS = ("total", "meta", "sep", "fail", "done")
+RUNNING = "진행중"
+
+
+def decode_status(text):
+    # 커드 상태 JSON -> {total, meta, sep, fail, done} (정수). JSON 이 아니면 None
+    if not isinstance(text, str) or not text.startswith("{"): return None
+    try:
+        raw = json.loads(text)
+        return {k: int(raw.get(k) or 0) for k in CURD_FIELDS}
+    except (ValueError, TypeError, AttributeError): return None
+
+
+class BatchIndex:
+    def __init__(self, records=()):
+        self._lock = threading.Lock()
+        self._rows = {}       # 배치ID -> (위치, 레코드, 커드 상태 또는 None)
+        self._curd = {}       # 대사중/분리중 커드 배치ID -> 위치
+        self._running = {}    # 상태가 '진행중' 인 배치ID -> 위치
+        for rec in records: self._put(dict(rec))
+
+    def _put(self, rec, pos=None):
+        bid = rec.get('배치ID')
+        if pos is None: pos = self._rows[bid][0] if bid in self._rows else len(self._rows)
+        status = decode_status(rec.get('상태')) if "커드" in str(rec.get('종류', '')) else None
+        self._rows[bid] = (pos, rec, status)
+        if status and (status['meta'] or status['sep']): self._curd[bid] = pos
+        else: self._curd.pop(bid, None)
+        if rec.get('상태') == RUNNING: self._running[bid] = pos
+        else: self._running.pop(bid, None)
+
+    def apply(self, change):
+        # CacheRegistry on_write 훅: {"append": [레코드...]} 또는 {"patch": (키 열, 키, {열: 값})}
+        with self._lock:
+            if "append" in change:
+                for rec in change["append"]: self._put(dict(rec))
+                return self
+            if "patch" in change:
+                _, key, values = change["patch"]
+                if key in self._rows:
+                    pos, rec, _ = self._rows[key]
+                    self._put(dict(rec, **values), pos)
+                return self
+        return None
+
+    def active_curd(self):
+        # [(레코드, 상태 dict)] 생산 시트 순서. 상태 dict 는 복사본 (호출한 쪽에서 수정 가능)
+        with self._lock:
+            rows = [self._rows[bid] for bid in sorted(self._curd, key=self._curd.get)]
+        return [(rec, dict(status)) for _, rec, status in rows]
+
+    def running(self):
+        # 상태가 '진행중' 인 배치 레코드 (pH 측정 대상)
+        with self._lock:
+            return [self._rows[bid][1] for bid in sorted(self._running, key=self._running.get)]
+
+    def get(self, batch_id):
+        row = self._rows.get(batch_id)
+        return row[1] if row else None
+
+    def __len__(self):
+        return len(self._rows)
+
@@ -0,0 +1,75 @@
+# 기준 데이터 (연간 일정, 원재료/제품 목록, 레시피, 처방)
+# - 프로세스에 한 번만 만들고 읽기 전용(MappingProxyType/tuple)으로 모든 세션이 같이 씀
+# - 세션에서 고치는 것(처방 추가/수정 등)은 overlay() 로 세션 몫의 작은 dict 에만 기록 (원본은 그대로)
+import collections
+from types import MappingProxyType
+
+
+def freeze(value):
+    # dict -> MappingProxyType, list -> tuple (안쪽까지)
+    if isinstance(value, dict): return MappingProxyType({k: freeze(v) for k, v in value.items()})
+    if isinstance(value, (list, tuple)): return tuple(freeze(v) for v in value)
+    return value
+
+
+def overlay(base):
+    # 세션별 쓰기 층: 읽을 때는 세션 수정분 -> 공유 원본 순서, 쓰기는 세션 수정분에만
+    return collections.ChainMap({}, base)
+
+
+SCHEDULE = freeze({
+    1: {"title": "1월 (JAN)", "main": ["동백꽃", "인삼사이다", "유기농 우유 커드"], "note": "동백꽃 pH 3.8~4.0 도달 시 종료"},
+    2: {"title": "2월 (FEB)", "main": ["갈대뿌리", "당근"], "note": "갈대뿌리 수율 약 37%"},
+    3: {"title": "3월 (MAR)", "main": ["봄꽃 대사", "표고버섯"], "note": "꽃:줄기 1:1"},
+    4: {"title": "4월 (APR)", "main": ["애기똥풀", "등나무꽃"], "note": "애기똥풀 전초"},
+    5: {"title": "5월 (MAY)", "main": ["개망초+아카시아 합제", "아카시아꽃", "뽕잎"], "note": "계란커드 스타터용"},
+    6: {"title": "6월 (JUN)", "main": ["매실", "개망초"], "note": "매실 씨 제거"},
+    7: {"title": "7월 (JUL)", "main": ["토종홉 꽃", "연꽃", "무궁화"], "note": "여름철 대사 속도 주의"},
+    8: {"title": "8월 (AUG)", "main": ["풋사과"], "note": "1:6 비율"},
+    9: {"title": "9월 (SEP)", "main": ["청귤", "장미꽃"], "note": "추석 준비"},
+    10: {"title": "10월 (OCT)", "main": ["송이버섯", "표고버섯", "산자나무"], "note": "송이 등외품"},
+    11: {"title": "11월 (NOV)", "main": ["무염김치", "생지황", "인삼"], "note": "김장"},
+    12: {"title": "12월 (DEC)", "main": ["동백꽃", "메주콩"], "note": "마감"}
+})
+
+_PRIORITY_MATERIALS = [
+    "우유", "계란", "배추", "무", "마늘", "대파", "양파", "생강", "배", 
+    "고춧가루", "찹쌀가루", "새우젓", "멸치액젓", "올리고당", "조성액", "EX", "정제수",
+    "인삼", "동백꽃", "표고버섯", "개망초", "아카시아 꽃"
+]
+_ALL_MATERIALS = [
+    "개망초", "개망초잎", "개망초꽃", "개망초가루", "아카시아 꽃", "아카시아 잎", "아카시아 꽃/잎", 
+    "애기똥풀 꽃", "애기똥풀 꽃/줄기", "동백꽃", "메주콩", "백태", "인삼", "수삼-5년근", "산양유", "우유", 
+    "철원 산삼", "인삼vpl", "갈대뿌리", "당근", "표고버섯", "등나무꽃", "등나무줄기", "등나무꽃/줄기", 
+    "개망초꽃8+아카시아잎1", "뽕잎", "뽕잎가루", "매실", "매실꽃", "매화꽃", "토종홉 꽃", "토종홉 꽃/잎", 
+    "연꽃", "무궁화꽃", "무궁화잎", "무궁화꽃/잎", "풋사과", "청귤", "장미꽃", "송이버섯", 
+    "산자나무열매", "싸리버섯", "무염김치", "생지황", "무염김칫물", "마늘", "대파", "부추", "저염김치", "유기농수삼",
+    "명태머리", "굵은멸치", "흑새우", "다시마", "냉동블루베리", "슈가", "원당", "이소말토 올리고당", "프락토 올리고당",
+    "고운 고춧가루", "굵은 고춧가루", "상황버섯", "영지버섯", "꽁치젓", "메가리젓", "어성초가루", "당두충가루"
+]
+# 자주 쓰는 원재료를 앞에, 나머지는 가나다순
+RAW_MATERIALS = tuple(_PRIORITY_MATERIALS) + tuple(sorted(set(_ALL_MATERIALS) - set(_PRIORITY_MATERIALS)))
+
+PRODUCTS = (
+    "시원한 것", "마시는 것", "커드 시원한 것", "계란 커드", "EX",
+    "철원산삼 대사체", "인삼대사체(PAGI) 항암용", "인삼대사체(PAGI) 뇌질환용",
+    "표고버섯 대사체", "개망초(EDF)", "장미꽃 대사체",
+    "애기똥풀 대사체", "인삼 사이다", "송이 대사체",
+    "PAGI 희석액", "Vitamin C", "SiO2", "계란커드 스타터",
+    "혼합 [E.R.P.V.P]", "혼합 [P.V.E]", "혼합 [P.P.E]",
+    "혼합 [Ex.P]", "혼합 [R.P]", "혼합 [Edf.P]", "혼합 [P.P]"
+)
+
+RECIPES = freeze({
+    "계란커드 스타터 [혼합]": {"desc": "대사체 단순 혼합", "batch_size": 9, "materials": {"개망초 대사체": 8, "아카시아잎 대사체": 1}},
+    "계란커드 스타터 [합제]": {"desc": "원물 8:1 혼합 대사", "batch_size": 9, "materials": {"개망초꽃(원물)": 8, "아카시아잎(원물)": 1, "EX": 36}},
+    "철원산삼 대사체": {"desc": "1:8 비율", "batch_size": 9, "materials": {"철원산삼": 1, "EX": 8}},
+})
+
+REGIMENS = freeze({
+    "울산 자궁근종": """1. 아침: 장미꽃 대사체 + 생수 350ml (격일)
+2. 취침 전: 인삼 전체 대사체 + 생수 1.8L 혼합물 500ml
+3. 식사 대용: 시원한 것 1병 + 계란-우유 대사체 1/2병
+4. 생활 습관: 자궁 보온, 기상 직후 골반 스트레칭
+5. 관리: 2주 단위 초음파 검사"""
+})
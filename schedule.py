@@ -0,0 +1,196 @@
+# 발송 일정 계산 (회차, 발송 가능일)
+# - 시작일은 환자 DB 를 읽을 때 한 번만 파싱 (parse_start_dates)
+# - RoundIndex: 전체 환자의 시작일/그룹을 배열로 들고 있다가 임의의 날짜(또는 날짜 목록)의 회차를 한 번에 계산
+#   앞으로의 발송일(시작일부터 매주/격주, 회차 한도까지)도 (날짜, 환자) 배열로 계산 (수요 예측용)
+# - DeliveryCalendar: 여러 해의 날짜별 발송 가능 여부/사유를 배열로 미리 계산해 두고 조회만 함
+import threading
+from datetime import date, datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+ROUND_LIMITS = {"매주 발송": 12, "격주 발송": 6}
+BIWEEKLY_GROUPS = ("격주 발송", "유방암", "울산")  # 격주 발송 목록에 나오는 그룹
+
+
+def _as_date(d):
+    return d.date() if isinstance(d, datetime) else d
+
+
+def parse_start_dates(values):
+    # 시작일 문자열 목록 -> (date 또는 None 목록, 형식이 잘못된 위치 목록)
+    raw = pd.Series([str(v).strip() for v in values], dtype=object)
+    blank = raw.isin(["", "nan", "None"])
+    parsed = pd.to_datetime(raw.where(~blank), format="%Y-%m-%d", errors="coerce")
+    retry = ~blank & parsed.isna()
+    if retry.any(): parsed[retry] = pd.to_datetime(raw[retry], format="mixed", errors="coerce")
+    bad = (~blank & parsed.isna()).to_numpy().nonzero()[0].tolist()
+    return parsed.to_numpy(dtype="datetime64[D]").tolist(), bad  # NaT -> None
+
+
+def _round_from_delta(delta, weekly):
+    weeks_passed = np.rint(delta / 7).astype(np.int64)
+    return np.where(weekly, weeks_passed + 1, weeks_passed // 2 + 1)
+
+
+def calculate_round_v4(start_date_input, current_date_input, group_type):
+    try:
+        if not start_date_input or str(start_date_input) == 'nan': return 0, "날짜없음"
+        start_date = start_date_input if isinstance(start_date_input, date) else pd.to_datetime(start_date_input).date()
+    except (ValueError, TypeError, OverflowError): return 1, "오류"
+    start_date = _as_date(start_date)
+    delta = (_as_date(current_date_input) - start_date).days
+    if delta < 0: return 0, start_date.strftime('%Y-%m-%d')
+    return int(_round_from_delta(delta, group_type == "매주 발송")), start_date.strftime('%Y-%m-%d')
+
+
+class RoundIndex:
+    # 환자 DB -> 이름/그룹/시작일 배열. 시작일이 없으면 회차 0("날짜없음"), 형식 오류면 1("오류")
+    def __init__(self, db):
+        self.names = list(db)
+        self.groups = [v.get('group', '') for v in db.values()]
+        self.weekly = np.array([g == "매주 발송" for g in self.groups], dtype=bool)
+        starts = [v.get('start_date') for v in db.values()]
+        # 형식 오류 여부는 parse_start_dates 의 판정 그대로 ("nan"/"None" 은 빈 값)
+        self.invalid = np.array([bool(v.get('start_date_error')) for v in db.values()], dtype=bool)
+        self.missing = np.array([s is None for s in starts], dtype=bool) & ~self.invalid
+        self.start = np.array([s or date(1970, 1, 1) for s in starts], dtype="datetime64[D]")
+        self.limits = np.where(self.weekly, ROUND_LIMITS["매주 발송"], ROUND_LIMITS["격주 발송"])
+        # 발송 목록에 나오고 시작일이 있는 환자만 발송일을 예측할 수 있음
+        self.scheduled = np.array([g == "매주 발송" or g in BIWEEKLY_GROUPS for g in self.groups], dtype=bool) & ~self.missing & ~self.invalid
+        self.labels = ["날짜없음" if m else "오류" if e else str(s) for m, e, s in zip(self.missing, self.invalid, self.start)]
+
+    def rounds_between(self, dates):
+        # 날짜 목록 -> (날짜, 환자) 회차 배열
+        d = np.array([_as_date(x) for x in dates], dtype="datetime64[D]")
+        delta = (d[:, None] - self.start[None, :]).astype(np.int64)
+        r = np.where(delta < 0, 0, _round_from_delta(delta, self.weekly[None, :]))
+        return np.where(self.missing[None, :], 0, np.where(self.invalid[None, :], 1, r))
+
+    def deliveries(self, first, n_days):
+        # first 부터 n_days 일 동안 (날짜, 환자) 발송 여부: 시작일과 같은 요일로 매주(7일)/격주(14일), 회차 한도(12/6)까지
+        # (rounds_between 의 회차가 바뀌는 날과 같음). 환자마다 발송은 한도 횟수뿐이므로 그 칸만 채움
+        first = np.datetime64(_as_date(first), "D")
+        period = np.where(self.weekly, 7, 14)
+        k = np.arange(self.limits.max(initial=0))
+        offset = (self.start - first).astype(np.int64)[:, None] + period[:, None] * k[None, :]
+        ok = (k[None, :] < self.limits[:, None]) & (offset >= 0) & (offset < n_days) & self.scheduled[:, None]
+        due = np.zeros((n_days, len(self.names)), dtype=bool)
+        due[offset[ok], np.nonzero(ok)[0]] = True
+        return due
+
+    def rounds(self, target_date):
+        return self.rounds_between([target_date])[0]
+
+    def at(self, target_date):
+        # {이름: (회차, 시작일 표시)} - calculate_round_v4 와 같은 결과
+        return dict(zip(self.names, zip(self.rounds(target_date).tolist(), self.labels)))
+
+    def over_limit(self, start_date, weeks):
+        # start_date 부터 weeks 주 동안 매주 같은 요일 기준으로 회차 한도(매주 12, 격주 6)를 넘는 환자
+        dates = [_as_date(start_date) + timedelta(weeks=k) for k in range(weeks + 1)]
+        r = self.rounds_between(dates)
+        over = r > self.limits[None, :]
+        hit = over.any(axis=0)
+        first = over.argmax(axis=0)
+        idx = np.nonzero(hit)[0]
+        return pd.DataFrame({
+            "환자": [self.names[i] for i in idx], "그룹": [self.groups[i] for i in idx],
+            "현재 회차": r[0, idx], "한도": self.limits[idx],
+            "초과 시점": [dates[first[i]] for i in idx], "그때 회차": r[first[idx], idx],
+        }).sort_values(["초과 시점", "환자"], ignore_index=True)
+
+
+_round_index = {}
+
+
+def round_index(db):
+    # 같은 환자 DB 객체면 인덱스 재사용 (db 참조를 같이 들고 있어서 id 가 재사용되지 않음)
+    hit = _round_index.get("db")
+    if hit is None or hit[0] is not db:
+        _round_index["db"] = (db, RoundIndex(db))
+    return _round_index["db"][1]
+
+
+WEEKDAY_NAMES = "월화수목금토일"
+OK, HOLIDAY, HOLIDAY_EVE = 0, 8, 9  # 1~7: 요일 금지 (1 + weekday)
+
+
+def _weekday_reason(weekday):
+    if weekday >= 5: return "⛔ **주말 발송 불가**"
+    return f"⛔ **{WEEKDAY_NAMES[weekday]}요일 발송 금지**"
+
+
+class DeliveryCalendar:
+    # holiday_source(years) -> {date: 휴일명}, 예: lambda years: holidays.KR(years=years)
+    # 규칙: blocked_weekdays(0=월 ... 6=일), block_holidays(당일 휴일), block_holiday_eve(익일 휴일)
+    # 날짜별 상태 코드는 int8 배열 하나, 발송 가능일/휴일은 정렬된 datetime64 배열 -> 조회는 인덱스 계산 또는 이분 탐색
+    def __init__(self, holiday_source, years, blocked_weekdays=(4, 5, 6), block_holidays=True, block_holiday_eve=True):
+        self.holiday_source = holiday_source
+        self.blocked_weekdays = tuple(sorted(set(blocked_weekdays)))
+        self.block_holidays = block_holidays
+        self.block_holiday_eve = block_holiday_eve
+        self._lock = threading.Lock()
+        self._build(range(min(years), max(years) + 1))
+
+    def _build(self, years):
+        # 다음 해 1월 1일 같은 경계 휴일도 익일 판정에 필요하므로 한 해 더 읽음
+        table = dict(self.holiday_source(list(years) + [years[-1] + 1]))
+        first, last = np.datetime64(f"{years[0]}-01-01", "D"), np.datetime64(f"{years[-1] + 1}-01-01", "D")
+        days = np.arange(first, last, dtype="datetime64[D]")
+        hol = sorted(table.items())
+        hol_days = np.array([d for d, _ in hol], dtype="datetime64[D]")
+
+        weekday = (days.astype(np.int64) + 3) % 7  # 1970-01-01 은 목요일
+        code = np.zeros(len(days), dtype=np.int8)
+        if self.block_holiday_eve: code[np.isin(days + 1, hol_days)] = HOLIDAY_EVE
+        if self.block_holidays: code[np.isin(days, hol_days)] = HOLIDAY
+        for w in self.blocked_weekdays: code[weekday == w] = 1 + w
+
+        # 상태를 한 번에 교체 (조회 중인 다른 스레드는 이전 배열을 계속 사용)
+        self._state = (first, years, code, days[code == OK], hol_days, [n for _, n in hol])
+
+    def _ensure(self, d):
+        first, years, *_ = self._state
+        if years[0] <= d.year <= years[-1]: return self._state
+        with self._lock:
+            first, years, *_ = self._state
+            if not years[0] <= d.year <= years[-1]:
+                self._build(range(min(years[0], d.year), max(years[-1], d.year) + 1))
+            return self._state
+
+    def status(self, d):
+        # (가능 여부, 사유): 막힌 요일 -> 당일 휴일 -> 익일 휴일 순으로 판정, 휴일이면 휴일명 포함
+        d = _as_date(d)
+        first, _, code, _, hol_days, names = self._ensure(d)
+        c = int(code[(np.datetime64(d, "D") - first).astype(np.int64)])
+        if c == OK: return True, "✅ **발송 가능**"
+        if c == HOLIDAY: return False, f"⛔ **휴일({names[np.searchsorted(hol_days, np.datetime64(d, 'D'))]})**"
+        if c == HOLIDAY_EVE: return False, "⛔ **익일 휴일**"
+        return False, _weekday_reason(c - 1)
+
+    def next_valid(self, d, n=1):
+        # d 를 포함해서 그 이후 발송 가능일 n 개
+        d = _as_date(d)
+        out, stop = [], d.year + 10  # 모든 요일을 막아 둔 경우 무한히 넓히지 않도록
+        while len(out) < n and d.year <= stop:
+            _, years, _, valid, *_ = self._ensure(d)
+            i = np.searchsorted(valid, np.datetime64(d, "D"))
+            out += valid[i:i + n - len(out)].tolist()
+            d = date(years[-1] + 1, 1, 1)
+        return out
+
+    def valid_between(self, start, end):
+        # start <= 날짜 <= end 인 발송 가능일
+        start, end = _as_date(start), _as_date(end)
+        self._ensure(start)
+        _, _, _, valid, *_ = self._ensure(end)
+        lo, hi = np.searchsorted(valid, [np.datetime64(start, "D"), np.datetime64(end + timedelta(days=1), "D")])
+        return valid[lo:hi].tolist()
+
+    def month_holidays(self, year, month):
+        # [(날짜, 휴일명)]
+        _, _, _, _, hol_days, names = self._ensure(date(year, month, 1))
+        nxt = date(year + (month == 12), month % 12 + 1, 1)
+        lo, hi = np.searchsorted(hol_days, [np.datetime64(date(year, month, 1), "D"), np.datetime64(nxt, "D")])
+        return list(zip(hol_days[lo:hi].tolist(), names[lo:hi]))
@@ -0,0 +1,321 @@
+# 저장소 계층
+# - Backend: 앱이 쓰는 저장소 인터페이스 (구글 시트 / SQLite(mirror.py) / 메모리)
+# - SheetSession: 구글 시트 구현. 프로세스당 하나의 인증 클라이언트를 유지하고 토큰은 만료될 때까지 재사용,
+#   스프레드시트/워크시트 핸들을 캐시해서 매 호출마다 open()/메타데이터 조회를 하지 않음
+#   행 수정은 첫 열 값(배치ID 등) -> 행 번호 색인으로 바로 찾아감. 색인은 추가할 때 이어 붙이고,
+#   쓰기 전에 그 행의 첫 열이 키와 같은지 확인해서 다르면(누가 행을 지우거나 끼워 넣음) 그때 다시 만듦
+# - MemoryBackend: 시트처럼 동작하는 메모리 저장소 (지연 주입, 호출 수 집계) - 벤치마크/부하 테스트용
+import collections
+import random
+import re
+import threading
+import time
+
+import gspread
+import requests
+from google.auth.exceptions import RefreshError, TransportError
+from google.oauth2.service_account import Credentials
+from gspread.utils import numericise_all
+
+SPREADSHEET_NAME = "vpmi_data"
+SCOPES = ["https://www.googleapis.com/auth/spreadsheets", "https://www.googleapis.com/auth/drive"]
+_UPDATED_RANGE = re.compile(r"![A-Z]+(\d+)")
+
+
+class RowConflict(Exception):
+    # 읽은 뒤 다른 사용자가 먼저 같은 행을 수정한 경우
+    pass
+
+
+def _is_auth_error(e):
+    if isinstance(e, RefreshError): return True
+    return isinstance(e, gspread.exceptions.APIError) and e.code == 401
+
+
+def _is_missing_sheet_error(e):
+    # 핸들을 캐시한 뒤 누군가 시트를 삭제하면 400(Unable to parse range) 또는 404가 돌아옴
+    if isinstance(e, gspread.exceptions.WorksheetNotFound): return True
+    return isinstance(e, gspread.exceptions.APIError) and e.code in (400, 404)
+
+
+def is_unavailable(e):
+    # 네트워크 끊김/타임아웃/쿼터 초과/서버 오류: 나중에 다시 시도하면 되는 경우
+    if isinstance(e, (requests.exceptions.ConnectionError, requests.exceptions.Timeout, TransportError)): return True
+    return isinstance(e, gspread.exceptions.APIError) and (e.code == 429 or e.code >= 500)
+
+
+class Backend:
+    # title=None 은 환자 DB(첫 번째 시트)
+    def read_records(self, title=None):
+        # get_all_records() 와 같은 형태의 레코드 리스트
+        raise NotImplementedError
+
+    def read_records_from(self, title, start):
+        # start 번째 데이터 행(0부터)부터의 레코드. 추가만 되는 시트의 증분 읽기용
+        return self.read_records(title)[start:]
+
+    def append_rows(self, title, rows, header=None):
+        # 시트가 없으면 header 로 만든 뒤 rows 를 한 번에 추가
+        raise NotImplementedError
+
+    def update_row(self, title, key, mutate, width=10):
+        # 첫 열이 key 인 행에 mutate(현재값) -> {열번호: 새값} 을 반영. 행이 없으면 False
+        raise NotImplementedError
+
+
+class SheetSession(Backend):
+    def __init__(self, secrets, spreadsheet_name=SPREADSHEET_NAME):
+        self._secrets = dict(secrets)
+        self._name = spreadsheet_name
+        self._lock = threading.RLock()
+        self._client = None
+        self._book = None
+        self._sheets = {}
+        self._first = None
+        self._row_locks = {}
+        self._row_index = {}  # 제목 -> {첫 열 값: 행 번호}
+
+    # --- 핸들 관리 ---
+    def client(self):
+        with self._lock:
+            if self._client is None:
+                creds = Credentials.from_service_account_info(self._secrets, scopes=SCOPES)
+                self._client = gspread.authorize(creds)
+            return self._client
+
+    def spreadsheet(self):
+        with self._lock:
+            if self._book is None:
+                self._load_handles(self.client().open(self._name))
+            return self._book
+
+    def _load_handles(self, book):
+        # 메타데이터 한 번으로 모든 워크시트 핸들 확보
+        worksheets = book.worksheets()
+        self._book = book
+        self._sheets = {ws.title: ws for ws in worksheets}
+        self._first = worksheets[0].title if worksheets else None
+
+    def worksheet(self, title=None, header=None):
+        # title=None 이면 첫 번째 시트(환자 DB)
+        with self._lock:
+            book = self.spreadsheet()
+            if title is None: title = self._first
+            ws = self._sheets.get(title)
+            if ws is None:
+                try: ws = book.worksheet(title)
+                except gspread.exceptions.WorksheetNotFound:
+                    if header is None: raise
+                    ws = self._create(title, header)
+                self._sheets[title] = ws
+            return ws
+
+    def _create(self, title, header, rows=()):
+        # 시트 생성 + 헤더 + 첫 데이터를 batchUpdate 한 번으로 처리
+        book = self.spreadsheet()
+        sheet_id = random.randint(1, 2**31 - 1)
+        width = max([10, len(header)] + [len(r) for r in rows])
+        body = {"requests": [
+            {"addSheet": {"properties": {"sheetId": sheet_id, "title": title, "sheetType": "GRID",
+                                         "gridProperties": {"rowCount": max(1000, len(rows) + 1), "columnCount": width}}}},
+            {"appendCells": {"sheetId": sheet_id, "fields": "userEnteredValue",
+                             "rows": [{"values": [_cell(v) for v in r]} for r in [header, *rows]]}},
+        ]}
+        res = book.batch_update(body)
+        props = res["replies"][0]["addSheet"]["properties"]
+        ws = gspread.Worksheet(book, props, book.id, book.client)
+        self._sheets[title] = ws
+        return ws
+
+    def forget(self, title=None):
+        with self._lock:
+            if self._book is None: return
+            self._row_index.pop(title, None)
+            if title is None or title == self._first:
+                # 첫 번째 시트가 바뀌었을 수 있으므로 핸들 목록을 다시 읽음 (open()은 다시 하지 않음)
+                self._load_handles(self._book)
+            else: self._sheets.pop(title, None)
+
+    def reset(self):
+        # 토큰 갱신 실패 시: 클라이언트만 다시 만들고 스프레드시트 키는 그대로 재사용
+        with self._lock:
+            key = self._book.id if self._book is not None else None
+            self._client = None
+            self._book = None
+            self._sheets = {}
+            self._row_index = {}
+            if key is not None: self._load_handles(self.client().open_by_key(key))
+
+    # --- 읽기 ---
+    def read_records(self, title=None):
+        return self.run(title, lambda ws: ws.get_all_records())
+
+    def read_records_from(self, title, start):
+        # 헤더 행과 start 이후 행만 요청 한 번으로 읽음
+        def _read(ws):
+            header, rows = ws.batch_get(["1:1", f"A{start + 2}:ZZ"])
+            header = header[0] if header else []
+            return [dict(zip(header, numericise_all((r + [""] * len(header))[:len(header)]))) for r in rows]
+        return self.run(title, _read)
+
+    # --- 쓰기 ---
+    def append_rows(self, title, rows, header=None):
+        # 여러 행을 요청 한 번으로 추가 (행 수와 무관하게 1회 호출)
+        rows = [list(r) for r in rows]
+        if not rows: return
+        with self._lock:
+            self.spreadsheet()
+            known = title in self._sheets
+            if not known and header is not None:
+                try:
+                    ws = self._create(title, header, rows)
+                    self._row_index[title] = {str(header[0]): 1} if header else {}
+                    self._index_rows(title, rows, 2)
+                    return ws
+                except gspread.exceptions.APIError as e:
+                    # 다른 프로세스가 먼저 만든 경우: 핸들을 다시 읽고 일반 추가로 진행
+                    if e.code != 400: raise
+                    self._load_handles(self._book)
+        res = self.run(title, lambda ws: ws.append_rows(rows), header=header)
+        # 응답의 updatedRange(예: production!A12:J13) 로 새 행 번호를 색인에 추가. 모르면 색인을 버림
+        m = _UPDATED_RANGE.search(((res or {}).get("updates") or {}).get("updatedRange", ""))
+        with self._lock:
+            if m: self._index_rows(title, rows, int(m.group(1)))
+            else: self._row_index.pop(title, None)
+
+    def _index_rows(self, title, rows, start):
+        # 색인이 이미 있을 때만 이어 붙임 (없으면 다음 수정 때 한 번에 만듦)
+        index = self._row_index.get(title)
+        if index is None: return
+        for i, r in enumerate(rows):
+            if r: index.setdefault(str(r[0]), start + i)
+
+    def _find_row(self, ws, title, key):
+        # 색인으로 행 번호를 찾고 그 행을 읽어 첫 열이 key 인지 확인. 어긋나면 첫 열을 다시 읽어 색인 재구성
+        index = self._row_index.get(title)
+        row = index.get(key) if index is not None else None
+        if row is not None:
+            current = ws.row_values(row)
+            if current and current[0] == key: return row, current
+        keys = ws.col_values(1)
+        index = {}
+        for i, k in enumerate(keys): index.setdefault(k, i + 1)  # 같은 키가 여럿이면 첫 행 (예전 find 와 같음)
+        self._row_index[title] = index
+        row = index.get(key)
+        return (row, ws.row_values(row)) if row is not None else (None, None)
+
+    def update_row(self, title, key, mutate, width=10):
+        # 읽기-수정-쓰기를 한 번에: 행 읽기 → mutate(현재값) → batch_update 1회
+        # mutate 는 {열번호: 새값} 을 돌려주고, 값이 예상과 다르면 RowConflict 를 던짐
+        def _rmw(ws):
+            row, current = self._find_row(ws, title, key)
+            if row is None: return False
+            current += [""] * (width - len(current))
+            changes = mutate(current)
+            if changes:
+                ws.batch_update([{"range": gspread.utils.rowcol_to_a1(row, col), "values": [[val]]} for col, val in sorted(changes.items())], raw=False)
+            return True
+        # 같은 프로세스 안에서는 시트 단위로 직렬화해서 동시 누적을 막음
+        with self._lock: lock = self._row_locks.setdefault(title, threading.Lock())
+        with lock:
+            return self.run(title, _rmw)
+
+    # --- 호출 래퍼 ---
+    def run(self, title, fn, header=None):
+        # fn(worksheet)을 실행하고, 만료된 토큰/삭제된 시트는 한 번만 복구 후 재시도
+        try:
+            return fn(self.worksheet(title, header))
+        except Exception as e:
+            if _is_auth_error(e): self.reset()
+            elif _is_missing_sheet_error(e): self.forget(title)
+            else: raise
+        return fn(self.worksheet(title, header))
+
+
+def _cell(v):
+    if isinstance(v, bool): return {"userEnteredValue": {"boolValue": v}}
+    if isinstance(v, (int, float)): return {"userEnteredValue": {"numberValue": v}}
+    return {"userEnteredValue": {"stringValue": "" if v is None else str(v)}}
+
+
+def _fmt(v):
+    # 시트에 RAW 로 쓴 값이 화면에 보이는 형태
+    if v is None: return ""
+    if isinstance(v, bool): return "TRUE" if v else "FALSE"
+    if isinstance(v, float) and v.is_integer(): return str(int(v))
+    return str(v)
+
+
+class MemoryBackend(Backend):
+    def __init__(self, sheets=None, latency=0.0, jitter=0.0):
+        # sheets: {제목: [헤더, 행, ...]} (첫 항목이 환자 DB), latency: 호출당 지연(초)
+        self.latency = latency
+        self.jitter = jitter
+        self.calls = collections.Counter()
+        self._lock = threading.Lock()
+        self._sheets = {}
+        self._row_index = {}
+        for title, values in (sheets or {}).items(): self.load(title, values)
+
+    def load(self, title, values):
+        with self._lock:
+            self._sheets[title] = [[_fmt(v) for v in row] for row in values]
+            self._row_index.pop(title, None)
+
+    def _call(self, kind):
+        self.calls[kind] += 1
+        delay = self.latency + (random.uniform(0, self.jitter) if self.jitter else 0)
+        if delay: time.sleep(delay)
+
+    def _values(self, title):
+        if title is None: title = next(iter(self._sheets), None)
+        if title not in self._sheets: raise gspread.exceptions.WorksheetNotFound(title)
+        return self._sheets[title]
+
+    def read_records(self, title=None):
+        return self.read_records_from(title, 0)
+
+    def read_records_from(self, title, start):
+        self._call("read")
+        with self._lock:
+            values = self._values(title)
+            if not values: return []
+            header = values[0]
+            return [dict(zip(header, numericise_all(row + [""] * (len(header) - len(row))))) for row in values[1 + start:]]
+
+    def append_rows(self, title, rows, header=None):
+        if not rows: return
+        self._call("write")
+        with self._lock:
+            if title not in self._sheets:
+                if header is None: raise gspread.exceptions.WorksheetNotFound(title)
+                self._sheets[title] = [[_fmt(v) for v in header]]
+            values = self._sheets[title]
+            index = self._row_index.get(title)
+            for i, r in enumerate(rows):
+                if index is not None and r: index.setdefault(_fmt(r[0]), len(values) + i)
+            values.extend([_fmt(v) for v in r] for r in rows)
+
+    def update_row(self, title, key, mutate, width=10):
+        # 시트 구현과 같은 호출 수: (색인이 맞으면) 행 읽기 + batch_update, 어긋나면 키 열 읽기 추가
+        with self._lock:
+            values = self._values(title)
+            idx = self._row_index.get(title, {}).get(key)
+        self._call("read")
+        if idx is None or idx >= len(values) or not values[idx] or values[idx][0] != key:
+            self._call("read")
+            with self._lock:
+                index = {}
+                for i, r in enumerate(values):
+                    if r: index.setdefault(r[0], i)
+                self._row_index[title] = index
+                idx = index.get(key)
+        if idx is None: return False
+        with self._lock:
+            row = values[idx]
+            changes = mutate(row + [""] * (width - len(row)))
+            if not changes: return True
+            row.extend([""] * (max(changes) - len(row)))
+            for col, val in changes.items(): row[col - 1] = _fmt(val)
+        self._call("write")
+        return True
@@ -0,0 +1,29 @@
+import sys
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from catalog import CATALOG, MIXED, PRODUCT_TABLE, SINGLE, ProductCatalog  # noqa: E402
+from refdata import RECIPES  # noqa: E402
+
+
+class RecipeCategoryTest(unittest.TestCase):
+    def test_recipes_are_mixed(self):
+        # 레시피가 있는 제품은 한책임에서 전개되어야 하므로 혼합 제품
+        # (표에 단일 제품으로 적힌 것만 예외: 철원산삼 대사체는 50ml 병으로 포장)
+        self.assertIn("계란커드 스타터 [혼합]", RECIPES)
+        for name in RECIPES:
+            if PRODUCT_TABLE.get(name, {}).get("category") == SINGLE: continue
+            pid = CATALOG.intern(name)
+            self.assertTrue(CATALOG.mixed[pid], name)
+            self.assertEqual(CATALOG.categories[pid], MIXED, name)
+
+    def test_unlisted_mixed_name(self):
+        catalog = ProductCatalog()
+        self.assertTrue(catalog.mixed[catalog.intern("새 제품 [혼합]")])
+        self.assertFalse(catalog.mixed[catalog.intern("새 제품")])
+
+
+if __name__ == "__main__":
+    unittest.main()